@@ -1,20 +1,83 @@
 import gradio as gr
+import threading
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from models.recommendation_engine import RecommendationEngine
-from components.gradio_ui import create_interface
+from components.gradio_ui import (
+    abatch_recommendations_api,
+    arecommendations_page_api,
+    create_interface,
+)
+from components.telemetry import telemetry
+from components.catalog_updates import DeltaWatcher
+from models.pydantic_schemas import (
+    BatchRecommendationRequest,
+    CatalogDelta,
+    RecommendationPageRequest,
+)
 from config import Config
 
 
 def main():
-    engine = RecommendationEngine()
+    # The server comes up right away and reports "starting" on /health until
+    # the model, catalog and warm-up are done
+    engine = RecommendationEngine(defer_startup=True)
+    threading.Thread(target=engine.start, name="engine-startup", daemon=True).start()
+
+    config = engine.config
+    if config.CATALOG_DELTA_DIR:
+        DeltaWatcher(
+            config.CATALOG_DELTA_DIR,
+            engine.apply_catalog_delta,
+            engine.ready.is_set,
+            config.CATALOG_DELTA_POLL_SECONDS,
+        ).start()
 
     interface = create_interface(engine)
 
-    interface.launch(
-        share=True,
-        server_name="0.0.0.0",
-        server_port=7860,
-        show_api=True,
-    )
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        status = engine.health()
+        return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return telemetry.render_prometheus()
+
+    @app.post("/recommendations/batch")
+    async def recommendations_batch(request: BatchRecommendationRequest):
+        if len(request.queries) > config.BATCH_MAX_QUERIES:
+            return JSONResponse(
+                {"error": f"At most {config.BATCH_MAX_QUERIES} queries per batch"},
+                status_code=400,
+            )
+        return await abatch_recommendations_api(request.queries, engine, request.top_k)
+
+    @app.post("/recommendations/page")
+    async def recommendations_page(request: RecommendationPageRequest):
+        if not request.cursor and not request.query:
+            return JSONResponse({"error": "Pass a query or a cursor"}, status_code=400)
+        return await arecommendations_page_api(
+            request.query, request.cursor, engine, request.page_size
+        )
+
+    if config.CATALOG_DELTA_API:
+
+        @app.post("/catalog/delta")
+        def catalog_delta(delta: CatalogDelta):
+            if not engine.ready.is_set():
+                return JSONResponse({"error": "starting"}, status_code=503)
+            try:
+                return engine.apply_catalog_delta(delta)
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+
+    app = gr.mount_gradio_app(app, interface, path="/")
+
+    uvicorn.run(app, host="0.0.0.0", port=7860)
 
 
 if __name__ == "__main__":
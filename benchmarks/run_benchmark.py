@@ -0,0 +1,302 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+import numpy as np
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, get_args
+from benchmarks.synthetic_catalog import generate_catalog
+from components.ann_index import IVFIndex
+from components.embedding_store import (
+    SOURCE_SUFFIX,
+    load_embedding_store,
+    write_embedding_store,
+)
+from components.gradio_ui import get_recommendations_api, serialize_results
+from config import Config, GENRE_LIST, COUNTRY_LIST, QUALITY_LEVELS
+from models.pydantic_schemas import Features
+from models.recommendation_engine import RecommendationEngine
+
+STAGES = ["parse", "filter", "encode", "score", "top_k", "serialize"]
+
+QUERY_TEMPLATES = [
+    "movies like Interstellar",
+    "dark 80s crime thrillers set in New York",
+    "feel-good animated family films",
+    "Korean revenge dramas",
+    "short documentaries about music",
+    "epic space opera series",
+    "cult horror from the 70s",
+    "recent French romantic comedies",
+]
+
+
+class HashingEncoder:
+    # Model-free stand-in for SentenceTransformer: each text maps to a fixed
+    # random unit vector, optionally with a simulated per-batch cost.
+
+    def __init__(self, dim: int, cost_ms: float = 0.0):
+        self.dim = dim
+        self.cost_ms = cost_ms
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs):
+        if self.cost_ms:
+            time.sleep(self.cost_ms / 1000)
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.stack([self._vector(text) for text in texts])
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+class LocalFeatureParser:
+    # Deterministic replacement for the LLM: the query text seeds the choice
+    # of filters, so the same query always produces the same Features.
+
+    def __init__(self):
+        self.genres = list(get_args(GENRE_LIST))
+        self.countries = list(get_args(COUNTRY_LIST))[:20]
+        self.quality_levels = list(QUALITY_LEVELS)
+
+    def parse(self, query: str) -> Features:
+        seed = int.from_bytes(hashlib.sha256(query.encode()).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+        decade = int(rng.integers(1950, 2020)) // 10 * 10
+        date_range = [decade, decade + 9] if rng.random() < 0.4 else [1900, 2025]
+
+        return Features(
+            movie_or_series=rng.choice(["movie", "tvSeries", "both"], p=[0.6, 0.2, 0.2]),
+            genres=list(rng.choice(self.genres, size=rng.integers(0, 3), replace=False)),
+            negative_genres=list(
+                rng.choice(self.genres, size=rng.integers(0, 2), replace=False)
+            ),
+            quality_level=rng.choice(self.quality_levels),
+            positive_themes=f"{query}: a story about {rng.integers(1_000_000)}",
+            negative_themes=(
+                f"avoid plot {rng.integers(1_000_000)}" if rng.random() < 0.3 else None
+            ),
+            date_range=date_range,
+            min_runtime_minutes=None,
+            max_runtime_minutes=120 if rng.random() < 0.2 else None,
+            country_of_origin=(
+                list(rng.choice(self.countries, size=1)) if rng.random() < 0.25 else []
+            ),
+            dont_wanted_countrys=[],
+            prompt_title=query[:40],
+        )
+
+
+class BenchmarkEngine(RecommendationEngine):
+    def __init__(self, config: Config, model, parser: LocalFeatureParser):
+        self.parser = parser
+        super().__init__(config=config, model=model, client=object())
+
+    def _parse_user_query(self, query: str) -> Features:
+        return self.parser.parse(query)
+
+
+def benchmark_config(data_file: str, search_mode: str) -> Config:
+    class BenchmarkConfig(Config):
+        DATA_FILE = data_file
+        EMBEDDING_FILE = data_file + ".embeddings.npy"
+        ANN_INDEX_FILE = data_file + ".ann.npz"
+        # Never the production bundle: Catalog.load prefers a bundle when present
+        CATALOG_BUNDLE_DIR = data_file + ".bundle"
+        SEARCH_MODE = search_mode
+        PARSE_CACHE_FILE = None
+        EMBEDDING_CACHE_FILE = None
+        # Every theme is encoded, so the encode stage is measured, not the cache
+        EMBEDDING_CACHE_SIZE = 0
+        # Each concurrency level replays the same queries; they must be ranked
+        # again, not served from the previous level's results
+        RESULT_CACHE_SIZE = 0
+
+    return BenchmarkConfig()
+
+
+def make_queries(n: int) -> List[str]:
+    return [f"{QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)]} #{i}" for i in range(n)]
+
+
+def measure_stages(engine: RecommendationEngine, queries: List[str]) -> Dict:
+    timings = {stage: [] for stage in STAGES}
+    candidates = []
+    catalog = engine.catalog
+    similarity = engine.similarity_calc
+
+    for query in queries:
+        t0 = time.perf_counter()
+        features = engine._parse_user_query(query)
+        t1 = time.perf_counter()
+        candidate_indices = engine.filter.apply_filters(catalog, features)
+        genre_scores = engine.filter.genre_scores(catalog, features, candidate_indices)
+        t2 = time.perf_counter()
+        if len(candidate_indices) == 0:
+            continue
+        query_embedding = similarity.build_query_embedding(features)
+        t3 = time.perf_counter()
+        scored = similarity.score_candidates(
+            query_embedding, features, catalog, candidate_indices, genre_scores
+        )
+        t4 = time.perf_counter()
+        results = similarity.select_top_k(catalog, scored)
+        t5 = time.perf_counter()
+        json.dumps(serialize_results(results))
+        t6 = time.perf_counter()
+
+        for stage, start, end in zip(STAGES, (t0, t1, t2, t3, t4, t5), (t1, t2, t3, t4, t5, t6)):
+            timings[stage].append(1000 * (end - start))
+        candidates.append(len(candidate_indices))
+
+    report = {stage: _summary(values) for stage, values in timings.items()}
+    report["mean_candidates"] = float(np.mean(candidates)) if candidates else 0.0
+    return report
+
+
+def measure_throughput(
+    engine: RecommendationEngine, queries: List[str], concurrency: int
+) -> Dict:
+    def run(query):
+        start = time.perf_counter()
+        get_recommendations_api(query, engine)
+        return 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(run, queries))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "qps": len(queries) / elapsed,
+        "latency_ms": _summary(latencies),
+    }
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    values = np.asarray(values)
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+    }
+
+
+def run_size(args, n_rows: int) -> Dict:
+    data_file = os.path.join(args.data_dir, f"synthetic_{n_rows}_{args.dim}.parquet")
+    if not os.path.exists(data_file):
+        print(f"Generating {n_rows} rows -> {data_file}")
+        generate_catalog(data_file, n_rows, dim=args.dim)
+
+    config = benchmark_config(data_file, args.search_mode)
+    if args.embedding_store or args.search_mode == "ann":
+        if not os.path.exists(config.EMBEDDING_FILE + SOURCE_SUFFIX):
+            write_embedding_store(data_file, config.EMBEDDING_FILE)
+    elif os.path.exists(config.EMBEDDING_FILE):
+        os.remove(config.EMBEDDING_FILE)
+    if args.search_mode == "ann" and not os.path.exists(config.ANN_INDEX_FILE):
+        IVFIndex.build(load_embedding_store(config.EMBEDDING_FILE)).save(
+            config.ANN_INDEX_FILE
+        )
+
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(args.model, trust_remote_code=True)
+    else:
+        model = HashingEncoder(args.dim, cost_ms=args.encode_cost_ms)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = BenchmarkEngine(config, model, LocalFeatureParser())
+    load_seconds = time.perf_counter() - start
+
+    queries = make_queries(args.queries)
+    report = {
+        "rows": n_rows,
+        "dim": args.dim,
+        "search_mode": args.search_mode,
+        "load_seconds": load_seconds,
+        "rss_mb": psutil.Process().memory_info().rss / 1024 / 1024,
+        "stages_ms": measure_stages(engine, queries),
+        "throughput": [
+            measure_throughput(engine, queries, concurrency)
+            for concurrency in args.concurrency
+        ],
+    }
+    _print_report(report)
+    return report
+
+
+def _print_report(report: Dict):
+    print(
+        f"\n== {report['rows']} rows x {report['dim']} dims ({report['search_mode']}) "
+        f"load={report['load_seconds']:.2f}s rss={report['rss_mb']:.0f}MB"
+    )
+    stages = report["stages_ms"]
+    print(f"mean candidates after filters: {stages['mean_candidates']:.0f}")
+    print(f"{'stage':<10} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for stage in STAGES:
+        s = stages[stage]
+        print(f"{stage:<10} {s['mean']:9.3f} {s['p50']:9.3f} {s['p95']:9.3f} {s['p99']:9.3f}")
+    print(f"{'workers':<10} {'qps':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for run in report["throughput"]:
+        latency = run["latency_ms"]
+        print(
+            f"{run['concurrency']:<10} {run['qps']:9.1f} {latency['p50']:9.3f} "
+            f"{latency['p95']:9.3f} {latency['p99']:9.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end latency benchmark on synthetic catalogs."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--search-mode", choices=["exact", "ann"], default="exact")
+    parser.add_argument(
+        "--embedding-store",
+        action="store_true",
+        help="Memory-map embeddings from a .npy store instead of decoding the parquet",
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="SentenceTransformer to encode with; defaults to a model-free hashing encoder",
+    )
+    parser.add_argument(
+        "--encode-cost-ms",
+        type=float,
+        default=0.0,
+        help="Simulated forward-pass time per batch for the hashing encoder",
+    )
+    parser.add_argument("--data-dir", default="benchmarks/data")
+    parser.add_argument("--output", default=None, help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    reports = [run_size(args, n_rows) for n_rows in args.rows]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
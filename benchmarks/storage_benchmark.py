@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+import numpy as np
+import torch
+from typing import Dict, List
+from benchmarks.run_benchmark import (
+    BenchmarkEngine,
+    HashingEncoder,
+    LocalFeatureParser,
+    benchmark_config,
+    make_queries,
+    _summary,
+)
+from benchmarks.synthetic_catalog import generate_catalog
+from components.embedding_store import write_embedding_store
+from components.quantization import CompactEmbeddings, STORAGE_MODES
+
+
+def make_query_embeddings(embeddings: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    # Perturbed catalog vectors, as in components.ann_index.evaluate_recall
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=n, replace=len(embeddings) < n)
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def first_pass_modes(dims: List[int]) -> List[tuple]:
+    # Exact float32 first, as the reference every other mode is compared to
+    modes = [(storage, None) for storage in STORAGE_MODES]
+    modes += [(storage, d) for d in dims for storage in STORAGE_MODES]
+    return modes
+
+
+def run_queries(engine, cases: List, top_k: int) -> Dict:
+    catalog = engine.catalog
+    similarity = engine.similarity_calc
+    latencies = []
+    rankings = []
+    for features, candidate_indices, genre_scores, query in cases:
+        start = time.perf_counter()
+        scored = similarity.score_candidates(
+            torch.from_numpy(query), features, catalog, candidate_indices, genre_scores, top_k
+        )
+        results = similarity.select_top_k(catalog, scored, top_k)
+        latencies.append(1000 * (time.perf_counter() - start))
+        rankings.append(results["tconst"])
+    return {"latency_ms": _summary(latencies), "rankings": rankings}
+
+
+def compare(rankings: List[np.ndarray], reference: List[np.ndarray]) -> Dict:
+    recalls = [
+        len(np.intersect1d(found, expected)) / len(expected)
+        for found, expected in zip(rankings, reference)
+        if len(expected)
+    ]
+    same_order = [
+        np.array_equal(found, expected) for found, expected in zip(rankings, reference)
+    ]
+    return {"recall": float(np.mean(recalls)), "same_order": float(np.mean(same_order))}
+
+
+def run_size(args, n_rows: int) -> Dict:
+    data_file = os.path.join(args.data_dir, f"synthetic_{n_rows}_{args.dim}.parquet")
+    if not os.path.exists(data_file):
+        print(f"Generating {n_rows} rows -> {data_file}")
+        generate_catalog(data_file, n_rows, dim=args.dim)
+
+    # The float32 matrix is memory-mapped, as it would be in compact mode
+    config = benchmark_config(data_file, "exact")
+    if not os.path.exists(config.EMBEDDING_FILE):
+        write_embedding_store(data_file, config.EMBEDDING_FILE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = BenchmarkEngine(config, HashingEncoder(args.dim), LocalFeatureParser())
+    catalog = engine.catalog
+
+    cases = []
+    queries = make_query_embeddings(catalog.embeddings, args.queries)
+    for text, query in zip(make_queries(args.queries), queries):
+        features = engine.parser.parse(text)
+        candidate_indices = engine.filter.apply_filters(catalog, features)
+        if len(candidate_indices) == 0:
+            continue
+        genre_scores = engine.filter.genre_scores(catalog, features, candidate_indices)
+        cases.append((features, candidate_indices, genre_scores, query))
+
+    report = {
+        "rows": n_rows,
+        "dim": args.dim,
+        "rerank_width": config.RERANK_WIDTH,
+        "mean_candidates": float(np.mean([len(case[1]) for case in cases])),
+        "modes": {},
+    }
+    reference = None
+    for storage, dims in first_pass_modes(args.dims):
+        build_seconds = 0.0
+        if storage == "float32" and dims is None:
+            catalog.compact = None
+            resident_bytes = catalog.embeddings.nbytes
+        else:
+            start = time.perf_counter()
+            catalog.compact = CompactEmbeddings.build(catalog.embeddings, storage, dims)
+            build_seconds = time.perf_counter() - start
+            resident_bytes = catalog.compact.nbytes
+
+        run_queries(engine, cases[: min(10, len(cases))], args.top_k)  # warm-up
+        run = run_queries(engine, cases, args.top_k)
+        if reference is None:
+            reference = run["rankings"]
+        report["modes"][f"{storage}/{dims or args.dim}"] = {
+            "resident_mb": resident_bytes / 1024 / 1024,
+            "build_seconds": build_seconds,
+            "latency_ms": run["latency_ms"],
+            **compare(run["rankings"], reference),
+        }
+
+    _print_report(report)
+    return report
+
+
+def _print_report(report: Dict):
+    print(
+        f"\n== {report['rows']} rows x {report['dim']} dims, "
+        f"rerank width {report['rerank_width']}, "
+        f"mean candidates {report['mean_candidates']:.0f}"
+    )
+    print(
+        f"{'first pass':<14} {'MB':>9} {'build s':>8} {'mean':>9} {'p50':>9} {'p95':>9} "
+        f"{'recall':>7} {'order':>6}"
+    )
+    for storage, mode in report["modes"].items():
+        latency = mode["latency_ms"]
+        print(
+            f"{storage:<14} {mode['resident_mb']:9.1f} {mode['build_seconds']:8.2f} "
+            f"{latency['mean']:9.3f} {latency['p50']:9.3f} {latency['p95']:9.3f} "
+            f"{mode['recall']:7.4f} {mode['same_order']:6.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare first-pass storage and truncation depth: memory, latency and recall."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument(
+        "--dims",
+        type=int,
+        nargs="*",
+        default=[128, 256],
+        help="Truncated first-pass depths to try in addition to the full vector",
+    )
+    parser.add_argument("--top-k", type=int, default=40)
+    parser.add_argument("--data-dir", default="benchmarks/data")
+    parser.add_argument("--output", default=None, help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    reports = [run_size(args, n_rows) for n_rows in args.rows]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
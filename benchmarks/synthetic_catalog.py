@@ -0,0 +1,109 @@
+import argparse
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import get_args
+from config import GENRE_LIST, COUNTRY_LIST
+
+TITLE_TYPES = ["movie", "tvSeries", "tvMiniSeries", "tvMovie", "video"]
+TITLE_TYPE_WEIGHTS = [0.55, 0.2, 0.05, 0.1, 0.1]
+
+
+def generate_catalog(
+    path: str,
+    n_rows: int,
+    dim: int = 1024,
+    n_clusters: int = 256,
+    batch_size: int = 50000,
+    seed: int = 0,
+):
+    # Writes a parquet with the demo_data.parquet schema in row groups of
+    # batch_size rows, so even 1M x 1024 catalogs never sit in memory at once.
+    # Embeddings are clustered around random centers so ANN recall behaves
+    # like it does on real overview embeddings.
+    rng = np.random.default_rng(seed)
+    genres = list(get_args(GENRE_LIST))
+    countries = list(get_args(COUNTRY_LIST))
+    # Zipf-like popularity so a few countries/genres dominate, like IMDb
+    genre_weights = _zipf_weights(len(genres))
+    country_weights = _zipf_weights(len(countries))
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = None
+    for start in range(0, n_rows, batch_size):
+        n = min(batch_size, n_rows - start)
+        rows = np.arange(start, start + n)
+
+        runtime = rng.integers(20, 240, size=n)
+        has_runtime = rng.random(n) > 0.05
+        votes = np.minimum(rng.pareto(1.2, size=n) * 500, 3_000_000).astype(np.int64) + 5
+        rating = np.clip(rng.normal(6.4, 1.2, size=n), 1.0, 10.0).round(1)
+
+        vectors = centers[rng.integers(0, n_clusters, size=n)]
+        vectors = vectors + rng.normal(scale=0.6, size=vectors.shape).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        table = pa.table(
+            {
+                "tconst": [f"tt{row:08d}" for row in rows],
+                "titleType": rng.choice(TITLE_TYPES, size=n, p=TITLE_TYPE_WEIGHTS),
+                "primaryTitle": [f"Synthetic Title {row}" for row in rows],
+                "startYear": rng.integers(1920, 2026, size=n).astype(str),
+                "runtimeMinutes": pa.array(
+                    [str(r) if ok else None for r, ok in zip(runtime, has_runtime)],
+                    type=pa.string(),
+                ),
+                "genres": _token_lists(rng, genres, genre_weights, n, max_tokens=3),
+                "averageRating": rating,
+                "numVotes": votes,
+                "overview": [f"Synthetic overview for title {row}." for row in rows],
+                "poster_url": [f"https://example.com/posters/{row}.jpg" for row in rows],
+                "country_of_origin": _token_lists(
+                    rng, countries, country_weights, n, max_tokens=2
+                ),
+                "finalScore": rating * np.log10(votes + 1),
+                "genreScore": np.zeros(n),
+                "embedding": pa.ListArray.from_arrays(
+                    pa.array(np.arange(0, (n + 1) * dim, dim, dtype=np.int32)),
+                    pa.array(vectors.reshape(-1)),
+                ),
+            }
+        )
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+
+    writer.close()
+
+
+def _zipf_weights(n: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1)
+    return weights / weights.sum()
+
+
+def _token_lists(rng, vocabulary, weights, n, max_tokens):
+    counts = rng.integers(1, max_tokens + 1, size=n)
+    return [
+        ", ".join(rng.choice(vocabulary, size=count, replace=False, p=weights))
+        for count in counts
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic catalog with the demo_data.parquet schema."
+    )
+    parser.add_argument("output_path")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_catalog(args.output_path, args.rows, dim=args.dim, seed=args.seed)
+    print(f"Wrote {args.rows} rows x {args.dim} dims to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import time
+import numpy as np
+from typing import Optional, Tuple
+from components.embedding_store import load_embedding_store
+
+
+class IVFIndex:
+    # Inverted-file index over the normalized catalog matrix: rows are bucketed
+    # by their nearest k-means centroid and a query only scans the buckets of
+    # its n_probe closest centroids.
+
+    def __init__(
+        self, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray
+    ):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.list_ids)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 20,
+        train_size: int = 100000,
+        seed: int = 42,
+    ) -> "IVFIndex":
+        n_rows = len(embeddings)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(
+            rng.choice(n_rows, size=min(train_size, n_rows), replace=False)
+        )
+        train = np.asarray(embeddings[train_rows], dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)].copy()
+
+        # Spherical k-means: vectors and centroids stay on the unit sphere, so
+        # the nearest centroid is the one with the largest dot product.
+        for _ in range(n_iter):
+            assignments = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, train)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            sums[empty] = centroids[empty]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        assignments = cls._assign(embeddings, centroids)
+        list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=n_lists)
+        list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return cls(centroids.astype(np.float32), list_offsets, list_ids)
+
+    @staticmethod
+    def _assign(
+        embeddings: np.ndarray, centroids: np.ndarray, batch_size: int = 50000
+    ) -> np.ndarray:
+        assignments = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), batch_size):
+            batch = np.asarray(embeddings[start : start + batch_size], dtype=np.float32)
+            assignments[start : start + len(batch)] = np.argmax(
+                batch @ centroids.T, axis=1
+            )
+        return assignments
+
+    def apply_delta(self, keep: np.ndarray, added: np.ndarray) -> "IVFIndex":
+        # Index over the rows at `keep` (renumbered from 0) followed by
+        # `added`. New rows join the list of their nearest existing centroid;
+        # the centroids are not retrained, so rebuild the index once a large
+        # share of the catalog has changed.
+        assignments = np.empty(self.n_rows, dtype=np.int64)
+        assignments[self.list_ids] = np.repeat(
+            np.arange(self.n_lists), np.diff(self.list_offsets)
+        )
+        assignments = np.concatenate(
+            [assignments[keep], self._assign(added, self.centroids)]
+        )
+        list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return IVFIndex(self.centroids, list_offsets, list_ids)
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_ids=self.list_ids,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as stored:
+            return cls(
+                stored["centroids"], stored["list_offsets"], stored["list_ids"]
+            )
+
+    def probe(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        n_probe = min(n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.concatenate(
+            [self.list_ids[self.list_offsets[l] : self.list_offsets[l + 1]] for l in lists]
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        embeddings: np.ndarray,
+        k: int,
+        n_probe: int = 8,
+        allowed: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns row ids and similarities of the k best rows in the probed
+        # lists, best first. `allowed` is a boolean row mask from the filters.
+        ids = self.probe(query, n_probe)
+        if allowed is not None:
+            ids = ids[allowed[ids]]
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+
+        scores = embeddings[ids] @ query
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+
+def exact_search(
+    query: np.ndarray, embeddings: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    scores = embeddings @ query
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    order = np.argsort(-scores[top], kind="stable")
+    return top[order], scores[top][order]
+
+
+def evaluate_recall(
+    index: IVFIndex,
+    embeddings: np.ndarray,
+    n_queries: int = 200,
+    k: int = 40,
+    n_probe: int = 8,
+    seed: int = 0,
+) -> dict:
+    # Queries are perturbed catalog vectors, which is close enough to real
+    # theme embeddings to compare ANN against the exact scan.
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    recalls = []
+    exact_time = 0.0
+    ann_time = 0.0
+    for query in queries:
+        start = time.perf_counter()
+        exact_ids, _ = exact_search(query, embeddings, k)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ann_ids, _ = index.search(query, embeddings, k, n_probe=n_probe)
+        ann_time += time.perf_counter() - start
+
+        recalls.append(len(np.intersect1d(exact_ids, ann_ids)) / len(exact_ids))
+
+    return {
+        f"recall@{k}": float(np.mean(recalls)),
+        "exact_ms": 1000 * exact_time / len(queries),
+        "ann_ms": 1000 * ann_time / len(queries),
+        "n_probe": n_probe,
+        "n_lists": index.n_lists,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an IVF index from the embedding store and report recall against exact search."
+    )
+    parser.add_argument("embedding_path", help=".npy file written by components.embedding_store")
+    parser.add_argument("index_path")
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--evaluate-only", action="store_true")
+    args = parser.parse_args()
+
+    embeddings = load_embedding_store(args.embedding_path)
+    if args.evaluate_only:
+        index = IVFIndex.load(args.index_path)
+    else:
+        start = time.perf_counter()
+        index = IVFIndex.build(embeddings, n_lists=args.n_lists)
+        index.save(args.index_path)
+        print(
+            f"Built {index.n_lists} lists over {index.n_rows} rows "
+            f"in {time.perf_counter() - start:.1f}s -> {args.index_path}"
+        )
+
+    report = evaluate_recall(
+        index, embeddings, n_queries=args.queries, n_probe=args.n_probe
+    )
+    print(
+        f"recall@40={report['recall@40']:.4f} "
+        f"exact={report['exact_ms']:.2f}ms ann={report['ann_ms']:.2f}ms "
+        f"(n_lists={report['n_lists']}, n_probe={report['n_probe']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, float("inf")]
+
+
+class EmbeddingBatcher:
+    # Coalesces encode requests from concurrent callers into one forward pass.
+    # The worker thread takes the first waiting request and, if others are
+    # already queued, keeps collecting for up to max_wait_ms or until
+    # max_batch_size texts are queued; it encodes the batch once and
+    # resolves each caller's future with its own rows.
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._queue_depths = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._batches = 0
+        self._texts = 0
+        self._max_queue_depth = 0
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            batch_texts = len(requests[0][0])
+            # A lone request goes straight away; waiting only pays off when
+            # others are already queued. Requests arriving during a forward
+            # pass are coalesced into the next one.
+            deadline = time.perf_counter()
+            if not self._queue.empty():
+                deadline += self.max_wait
+
+            while batch_texts < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        request = self._queue.get(timeout=timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                requests.append(request)
+                batch_texts += len(request[0])
+
+            self._record(len(requests), batch_texts, self._queue.qsize())
+            self._encode_batch(requests)
+
+    def _encode_batch(self, requests: list):
+        unique_texts = list(dict.fromkeys(t for texts, _ in requests for t in texts))
+        try:
+            encoded = self.model.encode(
+                unique_texts, convert_to_numpy=True, normalize_embeddings=True
+            ).astype(np.float32)
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        rows = {text: i for i, text in enumerate(unique_texts)}
+        for texts, future in requests:
+            future.set_result(encoded[[rows[t] for t in texts]])
+
+    def _record(self, n_requests: int, n_texts: int, backlog: int):
+        with self._stats_lock:
+            self._batches += 1
+            self._texts += n_texts
+            self._batch_sizes[_bucket(n_texts)] += 1
+            queue_depth = n_requests + backlog
+            self._queue_depths[_bucket(queue_depth)] += 1
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "texts": self._texts,
+                "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(self._batch_sizes),
+                "queue_depth_histogram": dict(self._queue_depths),
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+            }
+
+
+def _bucket(value: int) -> int:
+    # Smallest bucket bound >= value
+    for bucket in BATCH_SIZE_BUCKETS:
+        if value <= bucket:
+            return bucket
@@ -0,0 +1,246 @@
+import argparse
+import time
+import numpy as np
+from typing import Callable, Dict, Hashable, Optional
+from components.bitsets import popcount
+from components.cache import LRUCache
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Above this many rows a chunk's 8 KB bit container beats a uint16 array
+ARRAY_MAX = 4096
+
+
+class RoaringBitmap:
+    # Compressed set of row ids in the layout of Roaring bitmaps: rows are
+    # split into chunks of 65536 by their high 16 bits, and each non-empty
+    # chunk keeps either a sorted uint16 array of its low bits (sparse) or
+    # 1024 uint64 words (dense). The container type is the dtype. Run
+    # containers are left out: catalog rows are not ordered by any filter
+    # column, so predicates rarely form long runs.
+
+    def __init__(self, n_rows: int, containers: Dict[int, np.ndarray]):
+        self.n_rows = n_rows
+        self.containers = containers
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "RoaringBitmap":
+        containers = {}
+        for key, start in enumerate(range(0, len(mask), CHUNK_SIZE)):
+            chunk = mask[start : start + CHUNK_SIZE]
+            if len(chunk) < CHUNK_SIZE:
+                chunk = np.pad(chunk, (0, CHUNK_SIZE - len(chunk)))
+            container = _compact(np.packbits(chunk, bitorder="little").view(np.uint64))
+            if container is not None:
+                containers[key] = container
+        return cls(len(mask), containers)
+
+    def __len__(self) -> int:
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(container.nbytes for container in self.containers.values())
+
+    def to_indices(self) -> np.ndarray:
+        parts = []
+        for key, container in sorted(self.containers.items()):
+            if container.dtype == np.uint64:
+                values = np.flatnonzero(_unpack(container))
+            else:
+                values = container.astype(np.int64)
+            parts.append(values + (key << CHUNK_BITS))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def to_mask(self) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.to_indices()] = True
+        return mask
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, _and, self.containers.keys() & other.containers.keys())
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, _or, self.containers.keys() | other.containers.keys())
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        # AND NOT
+        return self._combine(other, _andnot, self.containers.keys())
+
+    def _combine(self, other: "RoaringBitmap", op, keys) -> "RoaringBitmap":
+        containers = {}
+        for key in keys:
+            container = op(self.containers.get(key), other.containers.get(key))
+            if container is not None:
+                containers[key] = container
+        return RoaringBitmap(self.n_rows, containers)
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint16:
+        return len(container)
+    return int(popcount(container).sum(dtype=np.int64))
+
+
+def _values(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint16:
+        return container
+    return np.flatnonzero(_unpack(container)).astype(np.uint16)
+
+
+def _unpack(words: np.ndarray) -> np.ndarray:
+    return np.unpackbits(words.view(np.uint8), bitorder="little").view(bool)
+
+
+def _words(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        return container
+    bits = np.zeros(CHUNK_SIZE, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+def _contains(words: np.ndarray, values: np.ndarray) -> np.ndarray:
+    bits = words[values >> 6] >> (values & 63).astype(np.uint64)
+    return (bits & np.uint64(1)).astype(bool)
+
+
+def _isin_sorted(values: np.ndarray, sorted_values: np.ndarray) -> np.ndarray:
+    # Binary search instead of the sort inside np.isin; both are sorted
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+
+def _intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    return small[_isin_sorted(small, large)]
+
+
+def _compact(words: np.ndarray) -> Optional[np.ndarray]:
+    # Picks the smaller container for a chunk, or None when it is empty
+    cardinality = _cardinality(words)
+    if cardinality == 0:
+        return None
+    if cardinality <= ARRAY_MAX:
+        return _values(words)
+    return words
+
+
+def _and(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if a is None or b is None:
+        return None
+    if a.dtype == np.uint16 and b.dtype == np.uint16:
+        result = _intersect_sorted(a, b)
+    elif a.dtype == np.uint16:
+        result = a[_contains(b, a)]
+    elif b.dtype == np.uint16:
+        result = b[_contains(a, b)]
+    else:
+        return _compact(a & b)
+    return result if len(result) else None
+
+
+def _or(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if a is None or b is None:
+        return b if a is None else a
+    if a.dtype == np.uint16 and b.dtype == np.uint16:
+        result = np.union1d(a, b)
+        return result if len(result) <= ARRAY_MAX else _words(result)
+    return _words(a) | _words(b)
+
+
+def _andnot(a: Optional[np.ndarray], b: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if a is None or b is None:
+        return a
+    if a.dtype == np.uint16:
+        if b.dtype == np.uint16:
+            result = a[~_isin_sorted(a, b)]
+        else:
+            result = a[~_contains(b, a)]
+        return result if len(result) else None
+    return _compact(a & ~_words(b))
+
+
+class BitmapCache:
+    # Rows matching single filter predicates (one title type group, one year
+    # range, one quality level, one country...), memoized as compressed
+    # bitmaps and combined per request. Keyed on the catalog version, so a
+    # swapped-in catalog never reads another one's rows; bounded by bytes.
+
+    def __init__(self, max_size: int, max_bytes: int):
+        self.memory = LRUCache(
+            max_size, max_bytes=max_bytes, size_of=lambda bitmap: bitmap.nbytes
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, version: Optional[str], predicate: Hashable, mask: Callable[[], np.ndarray]
+    ) -> RoaringBitmap:
+        key = repr((version, predicate))
+        bitmap = self.memory.get(key)
+        if bitmap is not None:
+            self.hits += 1
+            return bitmap
+        self.misses += 1
+        bitmap = RoaringBitmap.from_mask(mask())
+        # A catalog without a version cannot be told apart from the next one
+        if version is not None:
+            self.memory.set(key, bitmap)
+        return bitmap
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.memory),
+            "bytes": self.memory.nbytes,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time roaring-style bitmap AND/OR/ANDNOT against dense boolean masks."
+    )
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    masks = {
+        density: rng.random(args.rows) < density for density in (0.002, 0.05, 0.5)
+    }
+    bitmaps = {density: RoaringBitmap.from_mask(mask) for density, mask in masks.items()}
+    ops = {
+        "and": (np.logical_and, RoaringBitmap.__and__),
+        "or": (np.logical_or, RoaringBitmap.__or__),
+        "andnot": (lambda a, b: a & ~b, RoaringBitmap.__sub__),
+    }
+
+    print(f"{'op':<7} {'densities':<12} {'dense ms':>9} {'bitmap ms':>10} {'dense MB':>9} {'bitmap MB':>10}")
+    for name, (dense_op, bitmap_op) in ops.items():
+        for a, b in ((0.5, 0.05), (0.05, 0.002), (0.5, 0.5)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                expected = np.flatnonzero(dense_op(masks[a], masks[b]))
+            dense_ms = 1000 * (time.perf_counter() - start) / args.repeat
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                found = bitmap_op(bitmaps[a], bitmaps[b]).to_indices()
+            bitmap_ms = 1000 * (time.perf_counter() - start) / args.repeat
+            if not np.array_equal(expected, found):
+                raise SystemExit(f"{name} {a}/{b}: bitmap result differs from the mask")
+            print(
+                f"{name:<7} {f'{a}/{b}':<12} {dense_ms:9.3f} {bitmap_ms:10.3f} "
+                f"{(masks[a].nbytes + masks[b].nbytes) / 2**20:9.2f} "
+                f"{(bitmaps[a].nbytes + bitmaps[b].nbytes) / 2**20:10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    counts = _BYTE_POPCOUNT[words.view(np.uint8)]
+    return counts.reshape(words.shape + (words.itemsize,)).sum(axis=-1, dtype=np.uint8)
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class TokenBitset:
+    # Per-row bitmask over a token vocabulary (genres, countries), parsed once
+    # from the comma-separated catalog strings. Token i lives in bit i % 64 of
+    # word i // 64, so any-of tests and match counts become word-wise AND plus
+    # popcount over the whole catalog.
+
+    def __init__(self, vocabulary: List[str], bits: np.ndarray, present: np.ndarray):
+        self.vocabulary = vocabulary
+        self.token_ids = {token: i for i, token in enumerate(vocabulary)}
+        self.bits = bits
+        # Rows whose source value was a non-empty string
+        self.present = present
+
+    @classmethod
+    def from_strings(
+        cls,
+        values: Iterable,
+        vocabulary: Iterable[str] = (),
+        lowercase: bool = False,
+    ) -> "TokenBitset":
+        vocabulary = [cls._normalize(t, lowercase) for t in vocabulary]
+        token_ids = {token: i for i, token in enumerate(dict.fromkeys(vocabulary))}
+        present = []
+        row_ids = []
+        row_tokens = []
+
+        for row, value in enumerate(values):
+            if not isinstance(value, str) or not value:
+                present.append(False)
+                continue
+            present.append(True)
+            for token in value.split(","):
+                token = cls._normalize(token, lowercase)
+                token_id = token_ids.setdefault(token, len(token_ids))
+                row_ids.append(row)
+                row_tokens.append(token_id)
+
+        n_words = max(1, (len(token_ids) + 63) // 64)
+        bits = np.zeros((len(present), n_words), dtype=np.uint64)
+        row_tokens = np.array(row_tokens, dtype=np.uint64)
+        np.bitwise_or.at(
+            bits,
+            (np.array(row_ids, dtype=np.int64), (row_tokens // 64).astype(np.int64)),
+            np.left_shift(np.uint64(1), row_tokens % np.uint64(64)),
+        )
+        return cls(list(token_ids), bits, np.array(present, dtype=bool))
+
+    @classmethod
+    def concatenate(cls, bitsets: List["TokenBitset"]) -> "TokenBitset":
+        # Rows of bitsets built one after another, each seeded with the
+        # vocabulary of the previous one, so every vocabulary extends the last.
+        # Narrower bitsets are zero-padded: they never saw the newer tokens.
+        vocabulary = max((bitset.vocabulary for bitset in bitsets), key=len)
+        width = max(bitset.bits.shape[1] for bitset in bitsets)
+        bits = np.concatenate(
+            [
+                np.pad(bitset.bits, ((0, 0), (0, width - bitset.bits.shape[1])))
+                for bitset in bitsets
+            ]
+        )
+        present = np.concatenate([bitset.present for bitset in bitsets])
+        return cls(list(vocabulary), bits, present)
+
+    def take(self, rows: np.ndarray) -> "TokenBitset":
+        return TokenBitset(self.vocabulary, self.bits[rows], self.present[rows])
+
+    @staticmethod
+    def _normalize(token: str, lowercase: bool) -> str:
+        token = token.strip()
+        return token.lower() if lowercase else token
+
+    def mask(self, tokens: Iterable[str]) -> np.ndarray:
+        # Tokens outside the vocabulary appear in no row and are skipped.
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        for token in tokens:
+            token_id = self.token_ids.get(token)
+            if token_id is not None:
+                mask[token_id // 64] |= np.uint64(1 << (token_id % 64))
+        return mask
+
+    def count(self, mask: np.ndarray, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        bits = self.bits if indices is None else self.bits[indices]
+        return popcount(bits & mask).sum(axis=1, dtype=np.int64)
+
+    def any(self, mask: np.ndarray, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        bits = self.bits if indices is None else self.bits[indices]
+        return (bits & mask).any(axis=1)
+
+
+def genre_scores(
+    genres: TokenBitset,
+    target_genres: List[str],
+    negative_genres: List[str],
+    indices: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    # Vectorized MovieFilter.calculate_genre_score: the share of requested
+    # genres a title has, minus 0.5 per unwanted genre. Assumes a title lists
+    # each genre at most once, which holds for IMDb genre strings.
+    score = np.zeros(len(genres.bits) if indices is None else len(indices))
+    if target_genres:
+        positive = genres.mask(g.lower() for g in target_genres)
+        score = genres.count(positive, indices) / len(target_genres)
+    if negative_genres:
+        negative = genres.mask(g.lower() for g in negative_genres)
+        score = score - genres.count(negative, indices) * 0.5
+    return score.astype(np.float32)
+
+
+def country_mask(
+    countries: TokenBitset,
+    country_of_origin: List[str],
+    dont_wanted_countrys: List[str],
+) -> np.ndarray:
+    mask = countries.present.copy()
+    if dont_wanted_countrys:
+        mask &= ~countries.any(countries.mask(dont_wanted_countrys))
+    if country_of_origin:
+        mask &= countries.any(countries.mask(country_of_origin))
+    return mask
+
+
+def check_parity(parquet_path: str, n_cases: int = 200, seed: int = 0) -> int:
+    # Compares the bitset scoring against the row-wise string implementation
+    # over the whole catalog for random genre/country combinations.
+    from typing import get_args
+    from components.filters import MovieFilter
+    from config import GENRE_LIST, COUNTRY_LIST
+
+    data = pd.read_parquet(parquet_path, columns=["genres", "country_of_origin"])
+    genre_vocabulary = list(get_args(GENRE_LIST))
+    country_vocabulary = list(get_args(COUNTRY_LIST))
+    genres = TokenBitset.from_strings(data["genres"], genre_vocabulary, lowercase=True)
+    countries = TokenBitset.from_strings(data["country_of_origin"], country_vocabulary)
+    movie_filter = MovieFilter()
+    rng = np.random.default_rng(seed)
+
+    mismatches = 0
+    for _ in range(n_cases):
+        targets = list(rng.choice(genre_vocabulary, size=rng.integers(0, 4)))
+        negatives = list(rng.choice(genre_vocabulary, size=rng.integers(0, 3)))
+        expected = np.array(
+            [
+                movie_filter.calculate_genre_score(g, targets, negatives)
+                for g in data["genres"]
+            ],
+            dtype=np.float32,
+        )
+        mismatches += int((genre_scores(genres, targets, negatives) != expected).sum())
+
+        wanted = list(rng.choice(country_vocabulary, size=rng.integers(0, 3)))
+        unwanted = list(rng.choice(country_vocabulary, size=rng.integers(0, 2)))
+        if not wanted and not unwanted:
+            continue
+        expected = np.array(
+            [
+                movie_filter.country_matches(c, wanted, unwanted)
+                for c in data["country_of_origin"]
+            ],
+            dtype=bool,
+        )
+        mismatches += int((country_mask(countries, wanted, unwanted) != expected).sum())
+
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check bitset genre/country scoring against the string implementation."
+    )
+    parser.add_argument("parquet_path")
+    parser.add_argument("--cases", type=int, default=200)
+    args = parser.parse_args()
+
+    mismatches = check_parity(args.parquet_path, args.cases)
+    print(f"{mismatches} mismatched rows over {args.cases} random cases")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
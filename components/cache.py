@@ -0,0 +1,309 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class LRUCache:
+    # Thread-safe in-process LRU with an optional per-entry time to live,
+    # counted from the last set, or from the last get too with touch=True.
+    # With max_bytes, entries are also evicted once the sizes reported by
+    # size_of add up to more than that.
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        size_of: Optional[Callable[[Any], int]] = None,
+        touch: bool = False,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.touch = touch
+        self.max_bytes = max_bytes
+        self.size_of = size_of or (lambda value: 0)
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self._expired(stored_at):
+                self._remove(key)
+                return None
+            if self.touch:
+                self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time())
+            self.nbytes += self.size_of(value)
+            while len(self._entries) > self.max_size or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            value, stored_at = entry
+            return None if self._expired(stored_at) else value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.nbytes -= self.size_of(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, stored_at: float) -> bool:
+        return (
+            self.ttl_seconds is not None
+            and time.time() - stored_at > self.ttl_seconds
+        )
+
+
+class SQLiteStore:
+    # Small persistent key/value table so cached entries survive restarts.
+    # One connection is shared across threads behind a lock. Expired rows
+    # and the oldest rows beyond max_rows are pruned when the store opens
+    # and then at most every prune_interval_seconds, on set.
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        prune_interval_seconds: float = 60,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.prune_interval_seconds = prune_interval_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)"
+        )
+        self._conn.commit()
+        with self._lock:
+            self._prune()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.commit()
+            if time.time() - self._pruned_at > self.prune_interval_seconds:
+                self._prune()
+
+    def _prune(self):
+        # Caller holds the lock
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE stored_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+        if self.max_rows is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+        self._conn.commit()
+        self._pruned_at = time.time()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+
+class TieredCache:
+    # In-process LRU in front of an optional SQLite store. Disk hits are
+    # promoted into memory.
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+        max_disk_rows: Optional[int] = None,
+    ):
+        self.memory = LRUCache(max_size, ttl_seconds)
+        self.disk = SQLiteStore(path, ttl_seconds, max_disk_rows) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Requests on the scoring threads and the batcher read concurrently
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._record("memory_hits")
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._record("disk_hits")
+                self.memory.set(key, value)
+                return value
+
+        self._record("misses")
+        return None
+
+    def _record(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        lookups = memory_hits + disk_hits + misses
+        return {
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": (memory_hits + disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+class ResultCache:
+    # Ranked results by intent: the caller's key covers the parsed Features,
+    # top_k and the catalog version, so every phrasing of the same request
+    # shares an entry and a catalog swap makes the old entries unreachable.
+    # Values are dicts of NumPy arrays; memory is bounded by their bytes.
+
+    def __init__(self, max_size: int, max_bytes: int):
+        self.memory = LRUCache(max_size, max_bytes=max_bytes, size_of=_arrays_nbytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self.memory.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.memory),
+            "bytes": self.memory.nbytes,
+        }
+
+
+class CursorStore:
+    # Open paginated searches by cursor id. Each entry keeps what later pages
+    # need without a re-parse or re-scan: the parsed Features, the catalog
+    # version its rows belong to and the ranked rows and scores fetched so
+    # far. Idle cursors expire after the TTL; memory is bounded by the bytes
+    # of the stored rankings.
+
+    def __init__(self, max_size: int, ttl_seconds: float, max_bytes: int):
+        self.memory = LRUCache(
+            max_size,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            size_of=lambda entry: _arrays_nbytes(entry["ranked"]),
+            touch=True,
+        )
+        self.opened = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def open(self, entry: Dict[str, Any]) -> str:
+        cursor_id = secrets.token_urlsafe(12)
+        self.memory.set(cursor_id, entry)
+        self.opened += 1
+        return cursor_id
+
+    def get(self, cursor_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.memory.get(cursor_id)
+        if entry is None:
+            self.expired += 1
+        else:
+            self.resumed += 1
+        return entry
+
+    def update(self, cursor_id: str, entry: Dict[str, Any]):
+        self.memory.set(cursor_id, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "opened": self.opened,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "entries": len(self.memory),
+            "bytes": self.memory.nbytes,
+        }
+
+
+def _arrays_nbytes(value: Dict[str, Any]) -> int:
+    return sum(array.nbytes for array in value.values())
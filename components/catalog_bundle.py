@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List, Tuple
+from components.bitsets import TokenBitset
+from components.embedding_store import (
+    EMBEDDING_COLUMN,
+    build_embedding_matrix,
+    load_embedding_store,
+)
+
+BUNDLE_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+METADATA_FILE = "metadata.parquet"
+EMBEDDINGS_FILE = "embeddings.npy"
+# Typed columns stored as one .npy each, with their dtype
+ARRAY_COLUMNS = {
+    "start_year": np.int16,
+    "average_rating": np.float32,
+    "num_votes": np.int32,
+    "runtime_minutes": np.int16,
+    "final_score": np.float32,
+}
+BITSET_COLUMNS = ("genres", "countries")
+
+
+def bundle_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def build_bundle(
+    parquet_path: str, output_dir: str, batch_size: int = 10000
+) -> Dict:
+    # Streams the parquet once, batch by batch within its row groups. The
+    # embeddings go straight into a memory-mapped .npy and the display
+    # columns into a new parquet, so neither is ever held whole; only the
+    # small typed columns and bitsets are kept until the end. The bundle is
+    # written next to `output_dir` and renamed into place when complete.
+    from models.catalog import typed_columns
+
+    parquet_file = pq.ParquetFile(parquet_path)
+    total_rows = parquet_file.metadata.num_rows
+    if EMBEDDING_COLUMN not in parquet_file.schema_arrow.names:
+        raise ValueError(f"No {EMBEDDING_COLUMN!r} column in {parquet_path}")
+
+    staging_dir = f"{output_dir.rstrip(os.sep)}.building"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    metadata_writer = None
+    embeddings = None
+    offset = 0
+    genre_vocabulary = None
+    country_vocabulary = None
+    title_types = {}
+    parts = {name: [] for name in ARRAY_COLUMNS}
+    parts["title_types"] = []
+    bitset_parts = {name: [] for name in BITSET_COLUMNS}
+
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        table = pa.Table.from_batches([batch])
+        table = table.drop_columns(
+            [name for name in table.column_names if name.startswith("__index_level_")]
+        )
+        vectors = build_embedding_matrix(table.column(EMBEDDING_COLUMN).to_pandas())
+        metadata = table.drop_columns([EMBEDDING_COLUMN])
+
+        if embeddings is None:
+            embeddings = np.lib.format.open_memmap(
+                os.path.join(staging_dir, EMBEDDINGS_FILE),
+                mode="w+",
+                dtype=np.float32,
+                shape=(total_rows, vectors.shape[1]),
+            )
+            metadata_writer = pq.ParquetWriter(
+                os.path.join(staging_dir, METADATA_FILE), metadata.schema
+            )
+        embeddings[offset : offset + len(vectors)] = vectors
+        metadata_writer.write_table(metadata)
+        offset += len(vectors)
+
+        vocabularies = {}
+        if genre_vocabulary is not None:
+            vocabularies = {
+                "genre_vocabulary": genre_vocabulary,
+                "country_vocabulary": country_vocabulary,
+            }
+        columns = typed_columns(metadata.to_pandas(), **vocabularies)
+        genre_vocabulary = columns["genres"].vocabulary
+        country_vocabulary = columns["countries"].vocabulary
+        for name in ARRAY_COLUMNS:
+            parts[name].append(columns[name])
+        for name in BITSET_COLUMNS:
+            bitset_parts[name].append(columns[name])
+        parts["title_types"].append(
+            _encode_categories(columns["title_types"], title_types)
+        )
+
+    if embeddings is None:
+        shutil.rmtree(staging_dir)
+        raise ValueError(f"No rows found in {parquet_path}")
+    embeddings.flush()
+    dim = embeddings.shape[1]
+    del embeddings
+    metadata_writer.close()
+
+    arrays = {name: np.concatenate(parts[name]) for name in ARRAY_COLUMNS}
+    arrays["title_type_codes"] = np.concatenate(parts["title_types"])
+    for name in BITSET_COLUMNS:
+        bitset = TokenBitset.concatenate(bitset_parts[name])
+        arrays[f"{name}_bits"] = bitset.bits
+        arrays[f"{name}_present"] = bitset.present
+    for name, values in arrays.items():
+        np.save(os.path.join(staging_dir, f"{name}.npy"), values)
+
+    final_score = arrays["final_score"]
+    files = sorted(os.listdir(staging_dir))
+    checksums = {name: _sha256(os.path.join(staging_dir, name)) for name in files}
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        # Content address: changes whenever any file in the bundle does
+        "version": hashlib.sha256(
+            json.dumps(checksums, sort_keys=True).encode()
+        ).hexdigest()[:16],
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source": os.path.abspath(parquet_path),
+        "rows": total_rows,
+        "dim": dim,
+        "title_types": list(title_types),
+        "genre_vocabulary": genre_vocabulary,
+        "country_vocabulary": country_vocabulary,
+        "final_score_bounds": [float(final_score.min()), float(final_score.max())]
+        if len(final_score)
+        else [0.0, 0.0],
+        "files": {
+            name: {
+                "sha256": checksums[name],
+                "bytes": os.path.getsize(os.path.join(staging_dir, name)),
+            }
+            for name in files
+        },
+    }
+    with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    _replace_dir(staging_dir, output_dir)
+    return manifest
+
+
+def read_bundle(path: str) -> Tuple[pd.DataFrame, np.ndarray, Dict, Dict]:
+    # Everything comes back ready to use: the embeddings are memory-mapped
+    # and the typed columns are loaded as written, with no string parsing.
+    manifest = read_manifest(path)
+    data = pd.read_parquet(os.path.join(path, METADATA_FILE))
+    embeddings = load_embedding_store(os.path.join(path, EMBEDDINGS_FILE))
+    if len(data) != manifest["rows"] or len(embeddings) != manifest["rows"]:
+        raise ValueError(
+            f"Bundle {path} is incomplete: manifest says {manifest['rows']} rows, "
+            f"found {len(data)} metadata and {len(embeddings)} embedding rows"
+        )
+
+    def load(name):
+        return np.load(os.path.join(path, f"{name}.npy"))
+
+    columns = {name: load(name) for name in ARRAY_COLUMNS}
+    columns["title_types"] = pd.Categorical.from_codes(
+        load("title_type_codes"), manifest["title_types"]
+    )
+    for name, vocabulary in (
+        ("genres", manifest["genre_vocabulary"]),
+        ("countries", manifest["country_vocabulary"]),
+    ):
+        columns[name] = TokenBitset(
+            vocabulary, load(f"{name}_bits"), load(f"{name}_present")
+        )
+    final_min, final_max = manifest["final_score_bounds"]
+    columns["final_score_bounds"] = (np.float32(final_min), np.float32(final_max))
+    return data, embeddings, columns, manifest
+
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(
+            f"Bundle {path} has format {manifest.get('format')}, "
+            f"expected {BUNDLE_FORMAT}; rebuild it"
+        )
+    return manifest
+
+
+def verify_bundle(path: str) -> List[str]:
+    # Names of files whose checksum no longer matches the manifest. Loading
+    # does not check, since hashing the embeddings would cost what the
+    # bundle saves.
+    manifest = read_manifest(path)
+    mismatched = []
+    for name, entry in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or _sha256(file_path) != entry["sha256"]:
+            mismatched.append(name)
+    return mismatched
+
+
+def _encode_categories(values: pd.Categorical, categories: Dict) -> np.ndarray:
+    # Re-codes one batch's categorical against the categories of every batch
+    # so far; missing values keep code -1
+    for category in values.categories:
+        categories.setdefault(category, len(categories))
+    lookup = np.array(
+        [categories[category] for category in values.categories] + [-1],
+        dtype=np.int16,
+    )
+    return lookup[values.codes]
+
+
+def _sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace_dir(source: str, target: str):
+    # Renames are atomic; the old bundle is only removed once the new one is
+    # in place, so a reader never sees a half-written directory
+    previous = f"{target.rstrip(os.sep)}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(target):
+        os.rename(target, previous)
+    os.rename(source, target)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or verify the catalog serving bundle: typed columns, bitsets and normalized embeddings."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a bundle from the catalog parquet")
+    build.add_argument("parquet_path")
+    build.add_argument("output_dir")
+    build.add_argument("--batch-size", type=int, default=10000)
+    verify = commands.add_parser("verify", help="Check a bundle against its manifest")
+    verify.add_argument("bundle_dir")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        manifest = build_bundle(args.parquet_path, args.output_dir, args.batch_size)
+        size = sum(entry["bytes"] for entry in manifest["files"].values())
+        print(
+            f"Wrote bundle {manifest['version']} to {args.output_dir}: "
+            f"{manifest['rows']} rows x {manifest['dim']} dims, "
+            f"{size / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f}s"
+        )
+        return
+
+    mismatched = verify_bundle(args.bundle_dir)
+    if mismatched:
+        print(f"Checksum mismatch: {', '.join(mismatched)}")
+        raise SystemExit(1)
+    print(f"Bundle {args.bundle_dir} matches its manifest")
+
+
+if __name__ == "__main__":
+    main()
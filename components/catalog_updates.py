@@ -0,0 +1,207 @@
+import glob
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from typing import Callable, Dict, List, Tuple
+from components.bitsets import TokenBitset
+from components.catalog_bundle import ARRAY_COLUMNS
+from components.embedding_store import EMBEDDING_COLUMN, build_embedding_matrix
+from models.catalog import TYPED_SOURCE_COLUMNS, Catalog, typed_columns
+from models.pydantic_schemas import CatalogDelta
+
+# Catalog columns a delta may change on an existing row -> typed array
+UPDATABLE_COLUMNS = {
+    "averageRating": "average_rating",
+    "numVotes": "num_votes",
+    "finalScore": "final_score",
+}
+
+
+def apply_delta(
+    catalog: Catalog,
+    delta: CatalogDelta,
+    encode: Callable[[List[str]], np.ndarray],
+) -> Tuple[Catalog, Dict]:
+    # Builds the next catalog snapshot: `catalog` without the removed rows,
+    # with rating/vote updates applied, followed by the added rows. Nothing
+    # in `catalog` is modified, so requests still holding it keep a
+    # consistent view. Only the added rows are parsed and encoded.
+    added = pd.DataFrame(delta.added)
+    if len(added):
+        missing = [
+            column
+            for column in ["tconst"] + TYPED_SOURCE_COLUMNS
+            if column not in added.columns
+        ]
+        if missing:
+            raise ValueError(f"Added rows are missing columns {missing}")
+        duplicated = added["tconst"][added["tconst"].duplicated()].unique().tolist()
+        if duplicated:
+            raise ValueError(f"Added rows repeat tconst values {duplicated}")
+    replaced = added["tconst"].tolist() if len(added) else []
+
+    tconsts = catalog.data["tconst"].to_numpy()
+    removed = np.isin(tconsts, delta.removed)
+    keep = np.flatnonzero(~(removed | np.isin(tconsts, replaced)))
+
+    data = catalog.data.iloc[keep].reset_index(drop=True)
+    columns = {name: getattr(catalog, name)[keep] for name in ARRAY_COLUMNS}
+    columns["title_types"] = catalog.title_types[keep]
+    columns["genres"] = catalog.genres.take(keep)
+    columns["countries"] = catalog.countries.take(keep)
+    updated = _apply_updates(data, columns, delta.updated)
+
+    vectors = _added_embeddings(added, catalog.embeddings.shape[1], encode)
+    if len(added):
+        added = added.drop(columns=[EMBEDDING_COLUMN], errors="ignore")
+        added_columns = typed_columns(
+            added, catalog.genres.vocabulary, catalog.countries.vocabulary
+        )
+        for name in ARRAY_COLUMNS:
+            columns[name] = np.concatenate([columns[name], added_columns[name]])
+        columns["title_types"] = union_categoricals(
+            [columns["title_types"], added_columns["title_types"]]
+        )
+        for name in ("genres", "countries"):
+            columns[name] = TokenBitset.concatenate([columns[name], added_columns[name]])
+        data = pd.concat([data, added], ignore_index=True)
+
+    embeddings = np.concatenate([catalog.embeddings[keep], vectors])
+    updated_catalog = Catalog(data, embeddings, columns)
+    if catalog.compact is not None:
+        updated_catalog.compact = catalog.compact.apply_delta(keep, vectors)
+    if catalog.ann_index is not None:
+        updated_catalog.ann_index = catalog.ann_index.apply_delta(keep, vectors)
+    updated_catalog.version = _next_version(catalog.version)
+
+    summary = {
+        "version": updated_catalog.version,
+        "rows": len(updated_catalog),
+        "added": len(added),
+        "updated": updated,
+        "removed": int(removed.sum()),
+    }
+    return updated_catalog, summary
+
+
+def _apply_updates(data: pd.DataFrame, columns: Dict, updates: List[Dict]) -> int:
+    # Writes the new values into `data` and re-derives the typed arrays of
+    # just those rows. Unknown tconsts are skipped and not counted.
+    if not updates:
+        return 0
+    updates = pd.DataFrame(updates)
+    unknown = set(updates.columns) - {"tconst"} - set(UPDATABLE_COLUMNS)
+    if unknown:
+        raise ValueError(
+            f"Cannot update {sorted(unknown)}, only {list(UPDATABLE_COLUMNS)}"
+        )
+    row_index = pd.Index(data["tconst"])
+    if not row_index.is_unique:
+        raise ValueError("Catalog tconst values are not unique, cannot apply updates")
+    positions = row_index.get_indexer(updates["tconst"])
+    found = positions >= 0
+
+    for column, name in UPDATABLE_COLUMNS.items():
+        if column not in updates.columns:
+            continue
+        given = found & updates[column].notna().to_numpy()
+        rows = positions[given]
+        data.iloc[rows, data.columns.get_loc(column)] = updates[column].to_numpy()[given]
+        columns[name][rows] = typed_columns(data.iloc[rows])[name]
+    return int(found.sum())
+
+
+def _added_embeddings(
+    added: pd.DataFrame, dim: int, encode: Callable[[List[str]], np.ndarray]
+) -> np.ndarray:
+    # Rows may carry a precomputed embedding; the rest have their overview
+    # encoded with the serving model.
+    vectors = np.empty((len(added), dim), dtype=np.float32)
+    if not len(added):
+        return vectors
+    given = np.zeros(len(added), dtype=bool)
+    if EMBEDDING_COLUMN in added.columns:
+        given = added[EMBEDDING_COLUMN].notna().to_numpy()
+    if given.any():
+        vectors[given] = build_embedding_matrix(added[EMBEDDING_COLUMN][given])
+
+    missing = ~given
+    if missing.any():
+        if "overview" not in added.columns or added["overview"][missing].isna().any():
+            raise ValueError("Added rows need an embedding or an overview to encode")
+        vectors[missing] = encode(added["overview"][missing].tolist())
+    return vectors
+
+
+def _next_version(version) -> str:
+    base, _, count = (version or "parquet").partition("+")
+    return f"{base}+{int(count or 0) + 1}"
+
+
+class DeltaWatcher:
+    # Polls a directory for delta files (CatalogDelta as JSON) and applies
+    # them in file-name order. Each file is renamed to .applied or .failed
+    # once handled, so a restart does not apply it twice.
+
+    def __init__(
+        self,
+        directory: str,
+        apply: Callable[[CatalogDelta], Dict],
+        is_ready: Callable[[], bool] = lambda: True,
+        interval_seconds: float = 5.0,
+    ):
+        self.directory = directory
+        self.apply = apply
+        self.is_ready = is_ready
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._run, name="catalog-delta-watcher", daemon=True
+        )
+        self._thread.start()
+        print(f"Watching {self.directory} for catalog deltas")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            if self.is_ready():
+                self.poll()
+
+    def poll(self) -> int:
+        # A file modified within the last interval may still be being
+        # written, and one that is not valid JSON yet may be truncated; both
+        # are left in place for the next poll rather than marked .failed
+        applied = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            try:
+                if time.time() - os.path.getmtime(path) < self.interval_seconds:
+                    continue
+                with open(path) as f:
+                    content = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"Catalog delta {path} is not valid JSON yet, retrying: {e}")
+                continue
+            except FileNotFoundError:
+                continue
+            try:
+                summary = self.apply(CatalogDelta(**content))
+            except Exception as e:
+                print(f"Catalog delta {path} failed: {type(e).__name__}: {e}")
+                os.replace(path, path + ".failed")
+                continue
+            print(f"Applied catalog delta {path}: {summary}")
+            os.replace(path, path + ".applied")
+            applied += 1
+        return applied
@@ -0,0 +1,122 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+EMBEDDING_COLUMN = "embedding"
+# Written next to the .npy: which catalog rows, in which order, it holds
+SOURCE_SUFFIX = ".source.json"
+
+
+def build_embedding_matrix(embeddings: pd.Series) -> np.ndarray:
+    # One contiguous (N, D) float32 block, L2-normalized so cosine similarity
+    # against a normalized query is a plain dot product.
+    matrix = np.ascontiguousarray(np.stack(embeddings.to_numpy()), dtype=np.float32)
+    return _normalize_rows(matrix)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def write_embedding_store(
+    parquet_path: str, output_path: str, batch_size: int = 10000
+) -> tuple:
+    # Streams the embedding column batch by batch into a .npy file, so the
+    # build never holds more than one batch of vectors in memory.
+    parquet_file = pq.ParquetFile(parquet_path)
+    total_rows = parquet_file.metadata.num_rows
+    store = None
+    offset = 0
+
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=[EMBEDDING_COLUMN]
+    ):
+        vectors = build_embedding_matrix(
+            batch.column(EMBEDDING_COLUMN).to_pandas()
+        )
+        if store is None:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            store = np.lib.format.open_memmap(
+                output_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(total_rows, vectors.shape[1]),
+            )
+        store[offset : offset + len(vectors)] = vectors
+        offset += len(vectors)
+
+    if store is None:
+        raise ValueError(f"No embeddings found in {parquet_path}")
+    store.flush()
+    shape = store.shape
+    del store
+
+    tconsts = pq.read_table(parquet_path, columns=["tconst"]).column("tconst")
+    with open(output_path + SOURCE_SUFFIX, "w") as f:
+        json.dump(
+            {
+                "source": os.path.abspath(parquet_path),
+                "rows": total_rows,
+                "tconst_sha256": tconst_digest(tconsts.to_pylist()),
+            },
+            f,
+            indent=2,
+        )
+    return shape
+
+
+def tconst_digest(tconsts) -> str:
+    # Changes when rows are added, removed, replaced or re-ordered
+    return hashlib.sha256("\n".join(map(str, tconsts)).encode()).hexdigest()
+
+
+def embedding_store_matches(path: str, data: pd.DataFrame) -> bool:
+    # True when the store at `path` was written from exactly these catalog
+    # rows, in this order. A store without a source record never matches.
+    try:
+        with open(path + SOURCE_SUFFIX) as f:
+            source = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return source.get("rows") == len(data) and source.get(
+        "tconst_sha256"
+    ) == tconst_digest(data["tconst"])
+
+
+def load_embedding_store(path: str) -> np.ndarray:
+    # Read-only memory map: every worker process shares the same page cache
+    # copy instead of holding a private matrix.
+    return np.load(path, mmap_mode="r")
+
+
+def read_catalog_metadata(parquet_path: str) -> pd.DataFrame:
+    columns = [
+        name
+        for name in pq.read_schema(parquet_path).names
+        if name != EMBEDDING_COLUMN and not name.startswith("__index_level_")
+    ]
+    return pd.read_parquet(parquet_path, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the catalog embeddings to a flat, memory-mappable .npy file."
+    )
+    parser.add_argument("parquet_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    shape = write_embedding_store(args.parquet_path, args.output_path, args.batch_size)
+    print(f"Wrote {shape[0]} x {shape[1]} embeddings to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
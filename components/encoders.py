@@ -0,0 +1,187 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import List
+from config import Config
+from models.embedding_model import load_embedding_model, shared_model
+
+ENCODER_BACKENDS = ("torch", "compiled", "onnx", "onnx-int8")
+
+SAMPLE_QUERIES = [
+    "A retired hitman is pulled back into the criminal underworld to avenge his dog.",
+    "In 1970s New York, a Mafia don must navigate betrayal and FBI pressure.",
+    "A farmer and ex-NASA pilot crosses a wormhole to find humanity a new home.",
+    "Teenagers in a small town face a monster from a parallel dimension.",
+    "A Korean family schemes its way into the household of a wealthy employer.",
+    "feel-good animated family films",
+    "dark 80s crime thrillers",
+    "short documentaries about music",
+]
+
+
+def load_encoder(config: Config):
+    # Every backend is a SentenceTransformer, so callers keep the same
+    # model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    # call and the same query semantics (no prompt on the search path).
+    backend = config.ENCODER_BACKEND
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(
+            f"Unknown ENCODER_BACKEND {backend!r}, expected one of {ENCODER_BACKENDS}"
+        )
+    if config.ENCODER_THREADS > 0:
+        import torch
+
+        torch.set_num_threads(config.ENCODER_THREADS)
+
+    if backend == "torch":
+        return load_embedding_model(config.EMBEDDING_MODEL)
+    if backend == "compiled":
+        return shared_model(
+            (config.EMBEDDING_MODEL, backend), lambda: _compiled_model(config)
+        )
+    try:
+        return shared_model(
+            (config.EMBEDDING_MODEL, backend),
+            lambda: _onnx_model(config, quantized=backend == "onnx-int8"),
+        )
+    except ImportError as e:
+        print(f"ONNX backend unavailable ({e}), falling back to the torch encoder")
+        # Cached embeddings are keyed by the backend that actually encodes
+        config.ENCODER_BACKEND = "torch"
+        return load_embedding_model(config.EMBEDDING_MODEL)
+
+
+def _compiled_model(config: Config):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(config.EMBEDDING_MODEL, trust_remote_code=True)
+    eager = model[0].model
+    model[0].model = torch.compile(eager, dynamic=True)
+    # Compilation happens on the first call; do it now so a missing compiler
+    # toolchain shows up at startup rather than on a live query.
+    try:
+        model.encode(SAMPLE_QUERIES[:2], normalize_embeddings=True)
+    except Exception as e:
+        print(f"torch.compile failed ({type(e).__name__}: {e}), using the eager model")
+        model[0].model = eager
+    return model
+
+
+def _onnx_model(config: Config, quantized: bool):
+    import onnxruntime
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if config.ENCODER_THREADS > 0:
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = config.ENCODER_THREADS
+        model_kwargs["session_options"] = session_options
+
+    if not quantized:
+        return SentenceTransformer(
+            config.EMBEDDING_MODEL,
+            backend="onnx",
+            trust_remote_code=True,
+            model_kwargs=model_kwargs,
+        )
+
+    # The int8 graph is exported once into ENCODER_ONNX_DIR and reused
+    file_name = f"onnx/model_qint8_{config.ENCODER_QUANTIZATION}.onnx"
+    if not os.path.exists(os.path.join(config.ENCODER_ONNX_DIR, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        print(f"Exporting int8 ONNX encoder to {config.ENCODER_ONNX_DIR}")
+        model = SentenceTransformer(
+            config.EMBEDDING_MODEL, backend="onnx", trust_remote_code=True
+        )
+        model.save_pretrained(config.ENCODER_ONNX_DIR)
+        export_dynamic_quantized_onnx_model(
+            model, config.ENCODER_QUANTIZATION, config.ENCODER_ONNX_DIR
+        )
+
+    return SentenceTransformer(
+        config.ENCODER_ONNX_DIR,
+        backend="onnx",
+        trust_remote_code=True,
+        model_kwargs={"file_name": file_name, **model_kwargs},
+    )
+
+
+def check_parity(config: Config, texts: List[str], backend: str) -> dict:
+    # Encodes the same texts with the eager torch encoder and with `backend`,
+    # one text per call as on the live path, and compares them.
+    reference = load_embedding_model(config.EMBEDDING_MODEL)
+    config.ENCODER_BACKEND = backend
+    candidate = load_encoder(config)
+
+    report = {"backend": backend, "texts": len(texts)}
+    embeddings = {}
+    for name, model in (("torch", reference), (backend, candidate)):
+        model.encode(texts[:1], normalize_embeddings=True)  # warm-up
+        latencies = []
+        vectors = []
+        for text in texts:
+            start = time.perf_counter()
+            vectors.append(
+                model.encode([text], convert_to_numpy=True, normalize_embeddings=True)[0]
+            )
+            latencies.append(1000 * (time.perf_counter() - start))
+        embeddings[name] = np.stack(vectors).astype(np.float32)
+        report[f"{name}_p50_ms"] = float(np.percentile(latencies, 50))
+        report[f"{name}_p95_ms"] = float(np.percentile(latencies, 95))
+
+    cosines = np.sum(embeddings["torch"] * embeddings[backend], axis=1)
+    report["min_cosine"] = float(cosines.min())
+    report["mean_cosine"] = float(cosines.mean())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check an encoder backend against the eager torch encoder: cosine agreement and latency."
+    )
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, required=True)
+    parser.add_argument("--model", default=None, help="Defaults to Config.EMBEDDING_MODEL")
+    parser.add_argument(
+        "--data-file",
+        default=None,
+        help="Parquet whose overviews are added to the built-in sample queries",
+    )
+    parser.add_argument("--overviews", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    config = Config()
+    if args.model:
+        config.EMBEDDING_MODEL = args.model
+    if args.threads is not None:
+        config.ENCODER_THREADS = args.threads
+
+    texts = list(SAMPLE_QUERIES)
+    if args.data_file:
+        overviews = pd.read_parquet(args.data_file, columns=["overview"])["overview"]
+        texts += overviews.dropna().head(args.overviews).tolist()
+
+    report = check_parity(config, texts, args.backend)
+    print(
+        f"{report['backend']}: min cosine {report['min_cosine']:.5f}, "
+        f"mean {report['mean_cosine']:.5f} over {report['texts']} texts"
+    )
+    print(
+        f"per-query encode p50/p95: torch {report['torch_p50_ms']:.1f}/"
+        f"{report['torch_p95_ms']:.1f} ms, {report['backend']} "
+        f"{report[report['backend'] + '_p50_ms']:.1f}/"
+        f"{report[report['backend'] + '_p95_ms']:.1f} ms"
+    )
+    if report["min_cosine"] < args.min_cosine:
+        print(f"FAIL: cosine below {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
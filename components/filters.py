@@ -1,89 +1,187 @@
+import numpy as np
 import pandas as pd
 from models.pydantic_schemas import Features
-from typing import List, Optional
+from models.catalog import Catalog
+from components.bitsets import country_mask, genre_scores
+from components.bitmaps import BitmapCache, RoaringBitmap
+from components.telemetry import COUNT_BUCKETS, telemetry
+from typing import Iterator, List, Optional, Tuple
 import re
 from config import QUALITY_LEVELS
 
+MOVIE_TYPES = ["movie", "tvMovie", "video"]
+SERIES_TYPES = ["tvSeries", "tvMiniSeries"]
+ALL_TYPES = ["movie", "tvSeries", "tvMiniSeries", "tvMovie", "video"]
+
 
 class MovieFilter:
-    def __init__(self):
-        pass
+    def __init__(self, bitmap_cache: Optional[BitmapCache] = None):
+        self.bitmap_cache = bitmap_cache
 
-    def apply_filters(self, data: pd.DataFrame, features: Features) -> pd.DataFrame:
-        filtered_data = data.copy()
+    def apply_filters(self, catalog: Catalog, features: Features) -> np.ndarray:
+        # All constraints are AND-ed into one boolean mask over the typed
+        # catalog columns; the surviving row indices feed similarity scoring.
+        if self.bitmap_cache is not None:
+            return self._apply_cached_filters(catalog, features)
+        mask = np.ones(len(catalog), dtype=bool)
 
         if features.movie_or_series != "both":
-            filtered_data = self._filter_by_type(
-                filtered_data, features.movie_or_series
-            )
+            mask &= self._filter_by_type(catalog, features.movie_or_series)
+            self._record_candidates("type", mask)
 
-        if features.genres or features.negative_genres:
-            filtered_data["genreScore"] = filtered_data["genres"].apply(
-                lambda g: self.calculate_genre_score(
-                    g, features.genres or [], features.negative_genres or []
-                )
+        if features.date_range:
+            mask &= self._filter_by_date_range(catalog, features.date_range)
+            self._record_candidates("date_range", mask)
+
+        if features.quality_level:
+            mask &= self._filter_by_quality(catalog, features.quality_level)
+            self._record_candidates("quality", mask)
+
+        if (
+            features.min_runtime_minutes is not None
+            or features.max_runtime_minutes is not None
+        ):
+            mask &= self._filter_by_runtime(
+                catalog,
+                features.min_runtime_minutes,
+                features.max_runtime_minutes,
             )
-        else:
+            self._record_candidates("runtime", mask)
+        if features.country_of_origin or features.dont_wanted_countrys:
+            mask &= self._filter_by_country_of_origin(
+                catalog, features.country_of_origin, features.dont_wanted_countrys
+            )
+            self._record_candidates("country", mask)
+        return np.flatnonzero(mask)
+
+    def _apply_cached_filters(self, catalog: Catalog, features: Features) -> np.ndarray:
+        # Same constraints as the mask path, but each predicate's rows come
+        # from the bitmap cache and only the AND of them is computed per
+        # request
+        result = None
+        for filter_name, bitmap in self._predicate_bitmaps(catalog, features):
+            result = bitmap if result is None else result & bitmap
+            if telemetry.enabled:
+                self._record_count(filter_name, len(result))
+        if result is None:
+            return np.arange(len(catalog))
+        return result.to_indices()
+
+    def _predicate_bitmaps(
+        self, catalog: Catalog, features: Features
+    ) -> Iterator[Tuple[str, RoaringBitmap]]:
+        def cached(*predicate, mask):
+            return self.bitmap_cache.get(catalog.version, predicate, mask)
 
-            filtered_data["genreScore"] = 0.0
+        if features.movie_or_series != "both":
+            yield "type", cached(
+                "type",
+                features.movie_or_series,
+                mask=lambda: self._filter_by_type(catalog, features.movie_or_series),
+            )
 
         if features.date_range:
-            filtered_data = self._filter_by_date_range(
-                filtered_data, features.date_range
+            start_year, end_year = features.date_range
+            yield "date_range", cached(
+                "year",
+                start_year,
+                end_year,
+                mask=lambda: self._filter_by_date_range(catalog, [start_year, end_year]),
             )
 
-        if features.quality_level:
-            filtered_data = self._filter_by_quality(
-                filtered_data, features.quality_level
+        # "any" and unknown levels keep every row
+        if features.quality_level in QUALITY_LEVELS and features.quality_level != "any":
+            yield "quality", cached(
+                "quality",
+                features.quality_level,
+                mask=lambda: self._filter_by_quality(catalog, features.quality_level),
             )
 
         if (
             features.min_runtime_minutes is not None
             or features.max_runtime_minutes is not None
         ):
-            filtered_data = self._filter_by_runtime(
-                filtered_data,
+            yield "runtime", cached(
+                "runtime",
                 features.min_runtime_minutes,
                 features.max_runtime_minutes,
+                mask=lambda: self._filter_by_runtime(
+                    catalog, features.min_runtime_minutes, features.max_runtime_minutes
+                ),
             )
+
+        # country_mask as set algebra over one bitmap per country:
+        # present AND (any wanted) AND NOT (any unwanted)
         if features.country_of_origin or features.dont_wanted_countrys:
-            filtered_data = self._filter_by_country_of_origin(
-                filtered_data, features.country_of_origin, features.dont_wanted_countrys
-            )
-        return filtered_data
+            countries = catalog.countries
+            bitmap = cached("country_present", mask=lambda: countries.present)
+            for wanted, names in (
+                (True, features.country_of_origin),
+                (False, features.dont_wanted_countrys),
+            ):
+                if not names:
+                    continue
+                matches = None
+                for name in dict.fromkeys(names):
+                    country = cached(
+                        "country",
+                        name,
+                        mask=lambda name=name: countries.any(countries.mask([name])),
+                    )
+                    matches = country if matches is None else matches | country
+                bitmap = bitmap & matches if wanted else bitmap - matches
+            yield "country", bitmap
+
+    def _record_candidates(self, filter_name: str, mask: np.ndarray):
+        # Counting the mask is a full pass, so only pay for it when tracing
+        if not telemetry.enabled:
+            return
+        self._record_count(filter_name, int(np.count_nonzero(mask)))
+
+    def _record_count(self, filter_name: str, candidates: int):
+        telemetry.observe(
+            "filter_candidates", candidates, buckets=COUNT_BUCKETS, filter=filter_name
+        )
+        telemetry.annotate(**{f"candidates_after_{filter_name}": candidates})
+
+    def genre_scores(
+        self, catalog: Catalog, features: Features, indices: np.ndarray
+    ) -> np.ndarray:
+        if not (features.genres or features.negative_genres):
+            return np.zeros(len(indices), dtype=np.float32)
+
+        return genre_scores(
+            catalog.genres,
+            features.genres or [],
+            features.negative_genres or [],
+            indices,
+        )
 
     def _filter_by_runtime(
-        self, data: pd.DataFrame, min_runtime: Optional[int], max_runtime: Optional[int]
-    ) -> pd.DataFrame:
-
-        data = data.dropna(subset=["runtimeMinutes"])
-        data["runtimeMinutes"] = pd.to_numeric(
-            data["runtimeMinutes"], errors="coerce"
-        ).astype("Int64")
-
-        data = data.dropna(subset=["runtimeMinutes"])
+        self, catalog: Catalog, min_runtime: Optional[int], max_runtime: Optional[int]
+    ) -> np.ndarray:
+        runtime = catalog.runtime_minutes
+        mask = runtime >= 0
         if min_runtime is not None:
-            data = data[data["runtimeMinutes"] >= min_runtime]
+            mask &= runtime >= min_runtime
 
         if max_runtime is not None:
-            data = data[data["runtimeMinutes"] <= max_runtime]
+            mask &= runtime <= max_runtime
 
-        return data
+        return mask
 
-    def _filter_by_type(self, data: pd.DataFrame, movie_or_series: str) -> pd.DataFrame:
+    def _filter_by_type(self, catalog: Catalog, movie_or_series: str) -> np.ndarray:
         if movie_or_series == "movie":
-            movie_types = ["movie", "tvMovie", "video"]
-            return data[data["titleType"].isin(movie_types)]
+            return catalog.title_type_mask(MOVIE_TYPES)
         elif movie_or_series == "tvSeries":
-            series_types = ["tvSeries", "tvMiniSeries"]
-            return data[data["titleType"].isin(series_types)]
+            return catalog.title_type_mask(SERIES_TYPES)
         else:
-            all_types = ["movie", "tvSeries", "tvMiniSeries", "tvMovie", "video"]
-            return data[data["titleType"].isin(all_types)]
+            return catalog.title_type_mask(ALL_TYPES)
 
     def calculate_genre_score(
         self, row_genres: str, target_genres: List[str], negative_genres: List[str]
     ) -> float:
+        # Row-wise reference for the bitset genre scoring
         if not row_genres or pd.isna(row_genres):
             return 0.0
 
@@ -111,74 +209,73 @@ class MovieFilter:
 
     def _filter_by_country_of_origin(
         self,
-        data: pd.DataFrame,
+        catalog: Catalog,
         country_of_origin: List[str],
         dont_wanted_countrys: List[str] = None,
-    ) -> pd.DataFrame:
+    ) -> np.ndarray:
         if not country_of_origin and not dont_wanted_countrys:
-            return data
-
-        data_with_country = data.dropna(subset=["country_of_origin"])
+            return np.ones(len(catalog), dtype=bool)
 
-        def country_matches(row_countries: str) -> bool:
-            if not row_countries or pd.isna(row_countries):
-                return False
+        return country_mask(
+            catalog.countries, country_of_origin or [], dont_wanted_countrys or []
+        )
 
-            try:
-                row_country_list = [
-                    country.strip() for country in row_countries.split(",")
-                ]
+    def country_matches(
+        self,
+        row_countries: str,
+        country_of_origin: List[str],
+        dont_wanted_countrys: List[str] = None,
+    ) -> bool:
+        # Row-wise reference for the bitset country filter
+        if not row_countries or pd.isna(row_countries):
+            return False
 
-                if dont_wanted_countrys:
-                    has_unwanted = any(
-                        unwanted_country == row_country
-                        for unwanted_country in dont_wanted_countrys
-                        for row_country in row_country_list
-                    )
-                    if has_unwanted:
-                        return False
-
-                if country_of_origin:
-                    return any(
-                        target_country == row_country
-                        for target_country in country_of_origin
-                        for row_country in row_country_list
-                    )
+        try:
+            row_country_list = [country.strip() for country in row_countries.split(",")]
 
-                return True
+            if dont_wanted_countrys:
+                has_unwanted = any(
+                    unwanted_country == row_country
+                    for unwanted_country in dont_wanted_countrys
+                    for row_country in row_country_list
+                )
+                if has_unwanted:
+                    return False
+
+            if country_of_origin:
+                return any(
+                    target_country == row_country
+                    for target_country in country_of_origin
+                    for row_country in row_country_list
+                )
 
-            except (AttributeError, TypeError):
-                return False
+            return True
 
-        mask = data_with_country["country_of_origin"].apply(country_matches)
-        return data_with_country[mask]
+        except (AttributeError, TypeError):
+            return False
 
     def _filter_by_date_range(
-        self, data: pd.DataFrame, date_range: List[int]
-    ) -> pd.DataFrame:
+        self, catalog: Catalog, date_range: List[int]
+    ) -> np.ndarray:
         start_year, end_year = date_range
-        return data[
-            (data["startYear"].astype(int) >= start_year)
-            & (data["startYear"].astype(int) <= end_year)
-        ]
-
-    def _filter_by_quality(
-        self, data: pd.DataFrame, quality_level: str
-    ) -> pd.DataFrame:
+        return (catalog.start_year >= start_year) & (catalog.start_year <= end_year)
+
+    def _filter_by_quality(self, catalog: Catalog, quality_level: str) -> np.ndarray:
+        condition = np.ones(len(catalog), dtype=bool)
         if not quality_level or quality_level == "any":
-            return data
+            return condition
 
         config = QUALITY_LEVELS.get(quality_level)
         if config:
-            condition = pd.Series(True, index=data.index)
             if "min_rating" in config:
-                condition &= data["averageRating"] >= config["min_rating"]
+                condition &= catalog.average_rating >= config["min_rating"]
             if "max_rating" in config:
-                condition &= data["averageRating"] <= config["max_rating"]
+                condition &= catalog.average_rating <= config["max_rating"]
             if "min_votes" in config:
-                condition &= data["numVotes"] >= config["min_votes"]
+                condition &= catalog.num_votes >= config["min_votes"]
             if "max_votes" in config:
-                condition &= data["numVotes"] <= config["max_votes"]
-            return data[condition]
+                condition &= (catalog.num_votes >= 0) & (
+                    catalog.num_votes <= config["max_votes"]
+                )
 
-        return data
+        return condition
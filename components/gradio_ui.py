@@ -1,10 +1,39 @@
 import gradio as gr
 from models.recommendation_engine import RecommendationEngine
-import pandas as pd
-import asyncio
+from components.similarity import result_count
+from components.telemetry import telemetry
 
-pd.set_option("display.max_rows", 100)
-pd.set_option("display.max_columns", None)
+
+# API field -> result column; score columns are formatted to 4 decimals here,
+# at the last step before JSON
+API_FIELDS = {
+    "imdb_id": "tconst",
+    "title": "title",
+    "year": "year",
+    "type": "type",
+    "rating": "rating",
+    "runtime_minutes": "runtimeMinutes",
+    "votes": "votes",
+    "genres": "genres",
+    "similarity": "similarity_score",
+    "hybrid_score": "hybrid_score",
+    "overview": "overview",
+    "poster_url": "poster_url",
+    "final_score": "final_score",
+    "genre_score": "genre_score",
+    "country_of_origin": "country_of_origin",
+}
+FORMATTED_FIELDS = {"similarity", "hybrid_score", "final_score", "genre_score"}
+
+
+def serialize_results(results) -> list:
+    columns = []
+    for field, column in API_FIELDS.items():
+        values = results[column].tolist()
+        if field in FORMATTED_FIELDS:
+            values = [f"{value:.4f}" for value in values]
+        columns.append(values)
+    return [dict(zip(API_FIELDS, row)) for row in zip(*columns)]
 
 
 def get_recommendations_api(message, engine):
@@ -12,56 +41,69 @@ def get_recommendations_api(message, engine):
         return []
 
     try:
-        result = engine.get_recommendations(message)
-        df = result[1] if isinstance(result, tuple) and len(result) > 1 else None
-        if df is None or df.empty:
-            return []
-        prompt_title = result[0]
-        recommendations = []
-        for idx, (_, row) in enumerate(df.iterrows()):
-            recommendations.append(
-                {
-                    "imdb_id": row["tconst"],
-                    "title": row["title"],
-                    "year": row["year"],
-                    "type": row["type"],
-                    "rating": row["rating"],
-                    "runtime_minutes": row["runtimeMinutes"],
-                    "votes": row["votes"],
-                    "genres": row["genres"],
-                    "similarity": row["similarity_score"],
-                    "hybrid_score": row["hybrid_score"],
-                    "overview": row["overview"],
-                    "poster_url": row["poster_url"],
-                    "final_score": row["final_score"],
-                    "genre_score": row["genre_score"],
-                    "country_of_origin": row["country_of_origin"],
-                }
-            )
-
-        result_df = pd.DataFrame(recommendations)[
-            [
-                "title",
-                "final_score",
-                "genre_score",
-                "hybrid_score",
-                "similarity",
-                "votes",
-                "rating",
-            ]
-        ]
-        titles = result_df["title"].tolist()
-        print(titles)
-        print(result_df)
-        return {"recommendations": recommendations, "prompt_title": prompt_title}
+        return _format_response(engine.get_recommendations(message))
+    except Exception as e:
+        print(f"Error getting recommendations: {e}")
+        return []
+
+
+async def aget_recommendations_api(message, engine):
+    if not message:
+        return []
+
+    try:
+        return _format_response(await engine.aget_recommendations(message))
     except Exception as e:
         print(f"Error getting recommendations: {e}")
         return []
 
 
+async def abatch_recommendations_api(queries, engine, top_k: int = 40):
+    outcomes, throughput = await engine.aget_recommendations_batch(queries, top_k)
+    return {"results": [_outcome_response(outcome) for outcome in outcomes], **throughput}
+
+
+async def arecommendations_page_api(message, cursor, engine, page_size: int = 40):
+    outcome = await engine.aget_recommendations_page(message, cursor, page_size)
+    response = _outcome_response(outcome)
+    response["next_cursor"] = outcome[3] if len(outcome) > 3 else None
+    return response
+
+
+def _outcome_response(outcome) -> dict:
+    try:
+        formatted = _format_response(outcome)
+    except Exception as e:
+        print(f"Error formatting recommendations: {e}")
+        formatted = []
+    if formatted:
+        return formatted
+    if outcome[1] is None:
+        # The engine's message, so a caller can tell why it is empty
+        return {"recommendations": [], "error": outcome[0]}
+    return {"recommendations": [], "prompt_title": outcome[0]}
+
+
+def _format_response(result):
+    results = result[1] if isinstance(result, tuple) and len(result) > 1 else None
+    if results is None or result_count(results) == 0:
+        return []
+    prompt_title = result[0]
+    degraded = len(result) > 2 and result[2]
+    with telemetry.span("serialize"):
+        recommendations = serialize_results(results)
+
+    print(results["title"].tolist())
+    return {
+        "recommendations": recommendations,
+        "prompt_title": prompt_title,
+        "degraded": degraded,
+    }
+
+
 def create_interface(engine):
     async def predict_wrapper(message):
-        return await asyncio.to_thread(get_recommendations_api, message, engine)
+        return await aget_recommendations_api(message, engine)
 
     iface = gr.Interface(
         fn=predict_wrapper,
@@ -69,5 +111,8 @@ def create_interface(engine):
         outputs=gr.JSON(label="Recommendations"),
         title="Recommendation API",
         api_name="predict",
+        # Gradio runs one request at a time by default; the engine's own
+        # admission control (MAX_IN_FLIGHT) does the limiting instead
+        concurrency_limit=None,
     )
     return iface
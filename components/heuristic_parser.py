@@ -0,0 +1,218 @@
+import re
+from typing import List, Optional, Tuple, get_args
+from config import GENRE_LIST, COUNTRY_LIST, QUALITY_LEVELS
+from models.pydantic_schemas import Features
+
+# Words that map onto a genre without naming it
+GENRE_ALIASES = {
+    "sci fi": "Sci-Fi",
+    "scifi": "Sci-Fi",
+    "science fiction": "Sci-Fi",
+    "space": "Sci-Fi",
+    "anime": "Animation",
+    "animated": "Animation",
+    "cartoon": "Animation",
+    "funny": "Comedy",
+    "comedies": "Comedy",
+    "romantic": "Romance",
+    "rom com": "Romance",
+    "scary": "Horror",
+    "documentaries": "Documentary",
+    "biopic": "Biography",
+    "noir": "Film-Noir",
+    "detective": "Crime",
+    "heist": "Crime",
+    "mafia": "Crime",
+    "superhero": "Action",
+    "kids": "Family",
+    "historical": "History",
+    "musicals": "Musical",
+    "westerns": "Western",
+    "thrillers": "Thriller",
+    "dramas": "Drama",
+}
+
+# Same cues the LLM prompt lists under COUNTRY OF ORIGIN
+COUNTRY_ALIASES = {
+    "american": ["United States"],
+    "hollywood": ["United States"],
+    "usa": ["United States"],
+    "british": ["United Kingdom"],
+    "uk": ["United Kingdom"],
+    "bbc": ["United Kingdom"],
+    "french": ["France"],
+    "korean": ["South Korea"],
+    "k-drama": ["South Korea"],
+    "japanese": ["Japan"],
+    "indian": ["India"],
+    "bollywood": ["India"],
+    "turkish": ["Turkey"],
+    "german": ["Germany"],
+    "italian": ["Italy"],
+    "spanish": ["Spain"],
+    "russian": ["Russia"],
+    "chinese": ["China"],
+    "brazilian": ["Brazil"],
+    "mexican": ["Mexico"],
+    "canadian": ["Canada"],
+    "australian": ["Australia"],
+    "swedish": ["Sweden"],
+    "danish": ["Denmark"],
+    "norwegian": ["Norway"],
+    "nordic": ["Norway", "Sweden", "Denmark"],
+    "scandinavian": ["Norway", "Sweden", "Denmark"],
+}
+
+QUALITY_ALIASES = [
+    ("cult classic", "classic"),
+    ("all-time", "legendary"),
+    ("all time", "legendary"),
+    ("best ever", "legendary"),
+    ("masterpiece", "legendary"),
+    ("iconic", "classic"),
+    ("well-known", "popular"),
+    ("hidden gem", "niche"),
+    ("underrated", "niche"),
+]
+
+SERIES_WORDS = r"\b(series|tv shows?|shows|sitcoms?|miniseries|k-drama)\b"
+MOVIE_WORDS = r"\b(movies?|films?|cinema)\b"
+NEGATION = r"\b(?:no|not|without|except|avoid|skip)\s+(?:any\s+)?"
+
+MIN_YEAR, MAX_YEAR = 1900, 2025
+
+
+class HeuristicParser:
+    # Keyword/regex stand-in for the LLM parse, used when the parse misses
+    # its deadline or fails. It only fills what the query states literally;
+    # the query itself becomes positive_themes.
+
+    def __init__(self):
+        self.genres = {genre.lower(): genre for genre in get_args(GENRE_LIST)}
+        # "short" nearly always means runtime, not the Short genre
+        del self.genres["short"]
+        self.genres.update(GENRE_ALIASES)
+        self.countries = {
+            country.lower(): [country] for country in get_args(COUNTRY_LIST)
+        }
+        self.countries.update(COUNTRY_ALIASES)
+        self._genre_pattern = _alternation(self.genres)
+        self._country_pattern = _alternation(self.countries)
+
+    def parse(self, query: str) -> Features:
+        text = query.lower()
+        genres, negative_genres = self._match(self._genre_pattern, text, self.genres)
+        countries, negative_countries = self._match(
+            self._country_pattern, text, self.countries
+        )
+        min_runtime, max_runtime = self._runtime(text)
+
+        return Features(
+            movie_or_series=self._movie_or_series(text),
+            genres=_unique(genres),
+            negative_genres=_unique(negative_genres),
+            quality_level=self._quality_level(text),
+            positive_themes=query,
+            negative_themes=None,
+            date_range=self._date_range(text),
+            min_runtime_minutes=min_runtime,
+            max_runtime_minutes=max_runtime,
+            country_of_origin=_unique(_flatten(countries)),
+            dont_wanted_countrys=_unique(_flatten(negative_countries)),
+            prompt_title=query.strip()[:60],
+        )
+
+    @staticmethod
+    def _match(pattern: re.Pattern, text: str, vocabulary: dict) -> Tuple[list, list]:
+        wanted, unwanted = [], []
+        for match in pattern.finditer(text):
+            value = vocabulary[match.group(1)]
+            negated = re.search(NEGATION + r"$", text[: match.start()])
+            (unwanted if negated else wanted).append(value)
+        return wanted, unwanted
+
+    @staticmethod
+    def _movie_or_series(text: str) -> str:
+        series = re.search(SERIES_WORDS, text) is not None
+        movie = re.search(MOVIE_WORDS, text) is not None
+        if series and not movie:
+            return "tvSeries"
+        if movie and not series:
+            return "movie"
+        return "both"
+
+    @staticmethod
+    def _quality_level(text: str) -> str:
+        for phrase, level in QUALITY_ALIASES:
+            if phrase in text:
+                return level
+        for level in QUALITY_LEVELS:
+            if level != "any" and re.search(rf"\b{level}\b", text):
+                return level
+        return "any"
+
+    @staticmethod
+    def _date_range(text: str) -> List[int]:
+        # "1980s", "80s", "'90s" -> that decade
+        decade = re.search(r"\b(19|20)?(\d)0'?s\b", text)
+        if decade is not None:
+            century, digit = decade.group(1), decade.group(2)
+            if century is None:
+                century = "20" if digit in "012" else "19"
+            start = int(f"{century}{digit}0")
+            return [start, min(start + 9, MAX_YEAR)]
+
+        years = [int(y) for y in re.findall(r"\b(19\d{2}|20\d{2})\b", text)]
+        years = [y for y in years if MIN_YEAR <= y <= MAX_YEAR]
+        if len(years) >= 2:
+            return [min(years), max(years)]
+        if len(years) == 1:
+            if re.search(rf"\b(after|since|from)\s+{years[0]}", text):
+                return [years[0], MAX_YEAR]
+            if re.search(rf"\b(before|until|pre)\s+{years[0]}", text):
+                return [MIN_YEAR, years[0]]
+            return [years[0], years[0]]
+
+        # A bare "new" is too often a name ("New York", "new wave")
+        if re.search(
+            r"\b(recent|modern|latest)\b|\bnew (movies?|films?|releases?|shows?|series)\b",
+            text,
+        ):
+            return [2010, MAX_YEAR]
+        if re.search(r"\b(old|classic|vintage)\b", text):
+            return [1950, 1995]
+        return [MIN_YEAR, MAX_YEAR]
+
+    @staticmethod
+    def _runtime(text: str) -> Tuple[Optional[int], Optional[int]]:
+        limit = re.search(
+            r"\b(under|less than|shorter than|below|over|more than|longer than|above)\s+"
+            r"(\d+(?:\.\d+)?)\s*(h|hours?|hrs?|m|mins?|minutes?)\b",
+            text,
+        )
+        if limit is not None:
+            minutes = float(limit.group(2))
+            if limit.group(3).startswith("h"):
+                minutes *= 60
+            if limit.group(1) in ("under", "less than", "shorter than", "below"):
+                return None, int(minutes)
+            return int(minutes), None
+        if re.search(r"\bshort\b", text):
+            return None, 100
+        if re.search(r"\b(long|epic|multi-hour)\b", text):
+            return 150, None
+        return None, None
+
+
+def _alternation(vocabulary: dict) -> re.Pattern:
+    # Longest first so "science fiction" wins over "fiction"-like prefixes
+    words = sorted(vocabulary, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(w) for w in words) + r")\b")
+
+
+def _flatten(lists: List[list]) -> list:
+    return [item for items in lists for item in items]
+
+
+def _unique(values: list) -> list:
+    return list(dict.fromkeys(values))
@@ -0,0 +1,104 @@
+import numpy as np
+import torch
+from typing import Optional
+
+STORAGE_MODES = ("float32", "float16", "int8")
+
+
+class CompactEmbeddings:
+    # Low-precision and/or truncated copy of the normalized embedding matrix,
+    # used for a cheap first-pass similarity before the best rows are
+    # re-scored against the float32 matrix. int8 keeps one float32 scale per
+    # row (row ~= codes * scale); float16 needs none. With `dims`, only the
+    # leading dims of each vector are kept and re-normalized, which is how
+    # Matryoshka-trained models like Qwen3-Embedding are meant to be cut.
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+        dims: Optional[int] = None,
+    ):
+        self.codes = codes
+        self.scales = scales
+        self.dims = dims
+
+    @property
+    def storage(self) -> str:
+        return str(self.codes.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        storage: str,
+        dims: Optional[int] = None,
+        batch_size: int = 65536,
+    ) -> "CompactEmbeddings":
+        # Converts in batches so a memory-mapped float32 store is streamed
+        # rather than read into memory whole.
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown embedding storage {storage!r}")
+        n_rows, dim = embeddings.shape
+        if dims is not None and not 0 < dims <= dim:
+            raise ValueError(f"Cannot truncate {dim}-dim embeddings to {dims} dims")
+        if dims == dim:
+            dims = None
+        if storage == "float32" and dims is None:
+            raise ValueError("float32 first-pass embeddings need a truncation depth")
+
+        codes = np.empty((n_rows, dims or dim), dtype=storage)
+        scales = np.empty(n_rows, dtype=np.float32) if storage == "int8" else None
+
+        for start in range(0, n_rows, batch_size):
+            batch = np.asarray(embeddings[start : start + batch_size], dtype=np.float32)
+            if dims is not None:
+                batch = _normalize(batch[:, :dims])
+            if storage != "int8":
+                codes[start : start + len(batch)] = batch
+                continue
+            batch_scales = np.abs(batch).max(axis=1) / 127
+            batch_scales[batch_scales == 0] = 1.0
+            codes[start : start + len(batch)] = np.rint(batch / batch_scales[:, None])
+            scales[start : start + len(batch)] = batch_scales
+
+        return cls(codes, scales, dims)
+
+    def apply_delta(
+        self, keep: np.ndarray, added: np.ndarray
+    ) -> "CompactEmbeddings":
+        # The rows at `keep`, followed by `added` (normalized float32) built
+        # the same way; the original is left untouched for in-flight readers.
+        new = CompactEmbeddings.build(added, self.storage, self.dims)
+        codes = np.concatenate([self.codes[keep], new.codes])
+        scales = None
+        if self.scales is not None:
+            scales = np.concatenate([self.scales[keep], new.scales])
+        return CompactEmbeddings(codes, scales, self.dims)
+
+    def scores(
+        self, query: np.ndarray, rows: np.ndarray, chunk_size: int = 1024
+    ) -> np.ndarray:
+        # Approximate dot products of `rows` with a float32 query. Rows are
+        # widened to float32 a chunk at a time so the converted block stays
+        # in cache; widening all rows at once costs more than the float32 scan.
+        if self.dims is not None:
+            query = _normalize(query[: self.dims])
+        query = torch.from_numpy(np.ascontiguousarray(query, dtype=np.float32))
+        similarities = np.empty(len(rows), dtype=np.float32)
+        out = torch.from_numpy(similarities)
+        for start in range(0, len(rows), chunk_size):
+            chunk = torch.from_numpy(self.codes[rows[start : start + chunk_size]])
+            torch.mv(chunk.float(), query, out=out[start : start + chunk_size])
+        if self.scales is not None:
+            similarities *= self.scales[rows]
+        return similarities
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
@@ -0,0 +1,463 @@
+import argparse
+import os
+import queue
+import threading
+import time
+import uuid
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config, QUALITY_LEVELS
+from components.cache import LRUCache
+from components.filters import MovieFilter
+from components.similarity import RANKED_FIELDS, SimilarityCalculator
+from models.catalog import Catalog
+from models.pydantic_schemas import Features
+
+# Filtered rows wait this long on a shard for the scoring phase
+PENDING_TTL_SECONDS = 60
+
+
+def shard_bounds(rows: int, shards: int) -> List[Tuple[int, int]]:
+    # Contiguous row ranges of near-equal size; shard i owns [start, stop)
+    edges = np.linspace(0, rows, shards + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def check_supported(config: Config):
+    # Shards score every filtered row exactly. The compact first pass and the
+    # ANN index pick rows per shard, which would rank differently from one
+    # process, so those settings are refused rather than ignored.
+    unsupported = []
+    if config.SEARCH_MODE != "exact":
+        unsupported.append(f"SEARCH_MODE={config.SEARCH_MODE}")
+    if config.EMBEDDING_STORAGE != "float32":
+        unsupported.append(f"EMBEDDING_STORAGE={config.EMBEDDING_STORAGE}")
+    if config.FIRST_PASS_DIMS:
+        unsupported.append(f"FIRST_PASS_DIMS={config.FIRST_PASS_DIMS}")
+    if unsupported:
+        raise ValueError(
+            f"Sharded scoring is exact only, unset {', '.join(unsupported)}"
+        )
+
+
+def config_settings(config: Config) -> Dict[str, Any]:
+    # Every setting of `config`, including overrides made on the instance,
+    # in a form a spawned worker process can receive
+    return {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+
+def empty_ranked() -> Dict[str, np.ndarray]:
+    ranked = {name: np.empty(0, dtype=np.float32) for name in RANKED_FIELDS}
+    ranked["row"] = np.empty(0, dtype=np.int64)
+    return ranked
+
+
+class ShardWorker:
+    # One contiguous range of catalog rows, filtered and scored in its own
+    # process. A search takes two calls: "filter" keeps the shard's filtered
+    # rows under the request id and reports their finalScore range, and
+    # "score" ranks them with the range the coordinator merged from every
+    # shard. Rows go back as catalog-wide row ids.
+
+    def __init__(self, catalog: Catalog, start: int, config: Config):
+        self.catalog = catalog
+        self.start = start
+        self.filter = MovieFilter()
+        self.similarity_calc = SimilarityCalculator(None, config)
+        self.pending = LRUCache(config.SHARD_PENDING_SIZE, ttl_seconds=PENDING_TTL_SECONDS)
+
+    def handle(self, message: tuple):
+        method, *args = message
+        if method == "info":
+            return {
+                "version": self.catalog.version,
+                "start": self.start,
+                "rows": len(self.catalog),
+            }
+        if method == "filter":
+            return self.filter_rows(*args)
+        if method == "score":
+            return self.score(*args)
+        raise ValueError(f"Unknown shard method {method!r}")
+
+    def filter_rows(self, request_id: str, features: Features):
+        candidate_indices = self.filter.apply_filters(self.catalog, features)
+        if len(candidate_indices) == 0:
+            return 0, None
+        genre_scores = self.filter.genre_scores(self.catalog, features, candidate_indices)
+        self.pending.set(request_id, (features, candidate_indices, genre_scores))
+        final_scores = self.catalog.final_score[candidate_indices]
+        return len(candidate_indices), (final_scores.min(), final_scores.max())
+
+    def score(
+        self,
+        request_id: str,
+        query: np.ndarray,
+        final_score_range: Tuple[float, float],
+        top_k: int,
+    ) -> Dict[str, np.ndarray]:
+        pending = self.pending.pop(request_id)
+        if pending is None:
+            raise ValueError(f"No filtered rows for request {request_id}, filter first")
+        features, candidate_indices, genre_scores = pending
+        scored = self.similarity_calc.score_candidates(
+            torch.from_numpy(query),
+            features,
+            self.catalog,
+            candidate_indices,
+            genre_scores,
+            top_k,
+            final_score_range=final_score_range,
+        )
+        hybrid_scores = scored["hybrid_scores"]
+        top_indices = (
+            torch.topk(hybrid_scores, min(top_k, len(hybrid_scores))).indices.numpy()
+        )
+        return {
+            "row": scored["indices"][top_indices] + self.start,
+            "similarity_score": scored["similarities"].numpy()[top_indices],
+            "hybrid_score": hybrid_scores.numpy()[top_indices],
+            "genre_score": scored["genre_scores"][top_indices],
+        }
+
+
+def run_shard(
+    shard: int,
+    shards: int,
+    address: Tuple[str, int],
+    authkey: bytes,
+    settings: Optional[Dict[str, Any]] = None,
+    threads: int = 0,
+):
+    # Worker process entry point: loads the catalog as the engine would,
+    # keeps only this shard's rows and serves them until killed. Local
+    # workers get the coordinator's settings; remote ones use their own.
+    if threads > 0:
+        torch.set_num_threads(threads)
+    config = Config()
+    for name, value in (settings or {}).items():
+        setattr(config, name, value)
+    check_supported(config)
+    # The coordinator encodes queries; workers never use the embedding cache
+    config.EMBEDDING_CACHE_FILE = None
+    catalog = Catalog.load(config)
+    start, stop = shard_bounds(len(catalog), shards)[shard]
+    worker = ShardWorker(catalog.shard(start, stop), start, config)
+    del catalog
+    print(f"Shard {shard}/{shards} serving rows {start}-{stop} on {address[0]}:{address[1]}")
+    serve(worker, address, authkey)
+
+
+def serve(worker: ShardWorker, address: Tuple[str, int], authkey: bytes):
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"Shard connection refused: {type(e).__name__}: {e}")
+                continue
+            threading.Thread(
+                target=_serve_connection, args=(worker, conn), daemon=True
+            ).start()
+
+
+def _serve_connection(worker: ShardWorker, conn):
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", worker.handle(message))
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {e}")
+            conn.send(reply)
+
+
+class ShardClient:
+    # Connections to one shard worker. Each call takes an idle connection or
+    # opens one, so concurrent requests never share a socket.
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        authkey: bytes,
+        process=None,
+        rpc_timeout_seconds: float = 30.0,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.rpc_timeout_seconds = rpc_timeout_seconds
+        # The local worker process, if this coordinator started it
+        self.process = process
+        self._idle = queue.Queue()
+
+    def connect(self, timeout_seconds: float):
+        # Workers listen only once their catalog has loaded
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            try:
+                self._idle.put(Client(self.address, authkey=self.authkey))
+                return
+            except ConnectionRefusedError:
+                if self.process is not None and not self.process.is_alive():
+                    raise RuntimeError(
+                        f"Shard worker {self.process.name} exited with code "
+                        f"{self.process.exitcode}"
+                    )
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Shard {self.address} did not come up")
+                time.sleep(0.5)
+
+    def call(self, method: str, *args):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((method, *args))
+            # A hung worker would otherwise hold this request thread forever.
+            # The connection is dropped, so a late reply is never read as the
+            # answer to a later call.
+            if not conn.poll(self.rpc_timeout_seconds):
+                raise TimeoutError(
+                    f"Shard {self.address[0]}:{self.address[1]} did not answer "
+                    f"{method} within {self.rpc_timeout_seconds}s"
+                )
+            status, value = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        self._idle.put(conn)
+        if status != "ok":
+            raise RuntimeError(f"Shard {self.address[0]}:{self.address[1]}: {value}")
+        return value
+
+
+class ShardedSearch:
+    # Scatter-gather over shard workers. Phase one filters on every shard
+    # and merges their finalScore ranges, so the hybrid score normalizes
+    # finalScore over the whole filtered catalog exactly as one process
+    # would; phase two scores on the shards with candidates and merges their
+    # top-k into the global top-k.
+
+    def __init__(
+        self,
+        addresses: List[Tuple[str, int]],
+        authkey: bytes,
+        processes=None,
+        rpc_timeout_seconds: float = 30.0,
+    ):
+        self.processes = processes or [None] * len(addresses)
+        self.shards = [
+            ShardClient(address, authkey, process, rpc_timeout_seconds)
+            for address, process in zip(addresses, self.processes)
+        ]
+        self._executor = ThreadPoolExecutor(
+            max_workers=4 * len(addresses), thread_name_prefix="shard-rpc"
+        )
+
+    @classmethod
+    def start_local(cls, config: Config, shards: int) -> "ShardedSearch":
+        # Spawns the workers on localhost and returns before they are up;
+        # connect() waits for them
+        check_supported(config)
+        authkey = (config.SHARD_AUTHKEY or os.urandom(16).hex()).encode()
+        threads = max(1, (os.cpu_count() or 1) // shards)
+        addresses = [("127.0.0.1", config.SHARD_BASE_PORT + i) for i in range(shards)]
+        context = get_context("spawn")
+        processes = []
+        for shard, address in enumerate(addresses):
+            process = context.Process(
+                target=run_shard,
+                args=(shard, shards, address, authkey, config_settings(config), threads),
+                name=f"shard-{shard}",
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        return cls(addresses, authkey, processes, config.SHARD_RPC_TIMEOUT_SECONDS)
+
+    @classmethod
+    def from_config(cls, config: Config) -> "ShardedSearch":
+        if config.SHARD_ADDRESSES:
+            check_supported(config)
+            if not config.SHARD_AUTHKEY:
+                raise ValueError("SHARD_ADDRESSES needs SHARD_AUTHKEY")
+            addresses = [_parse_address(address) for address in config.SHARD_ADDRESSES]
+            return cls(
+                addresses,
+                config.SHARD_AUTHKEY.encode(),
+                rpc_timeout_seconds=config.SHARD_RPC_TIMEOUT_SECONDS,
+            )
+        return cls.start_local(config, config.SHARD_WORKERS)
+
+    def connect(self, catalog: Catalog, timeout_seconds: float):
+        # Waits for every worker and checks that together they hold exactly
+        # `catalog`: same version, contiguous rows, nothing missing
+        for shard in self.shards:
+            shard.connect(timeout_seconds)
+        infos = self._call_all("info")
+        expected_start = 0
+        for info in infos:
+            if info["version"] != catalog.version or info["start"] != expected_start:
+                raise RuntimeError(
+                    f"Shard {info} does not match catalog {catalog.version} "
+                    f"at row {expected_start}"
+                )
+            expected_start += info["rows"]
+        if expected_start != len(catalog):
+            raise RuntimeError(
+                f"Shards hold {expected_start} rows, the catalog has {len(catalog)}"
+            )
+        print(f"Connected to {len(self.shards)} catalog shards")
+
+    def search(self, features: Features, query: np.ndarray, top_k: int) -> Dict[str, np.ndarray]:
+        request_id = uuid.uuid4().hex
+        filtered = self._call_all("filter", request_id, features)
+        active = [i for i, (count, _) in enumerate(filtered) if count]
+        if not active:
+            return empty_ranked()
+        final_score_range = (
+            min(filtered[i][1][0] for i in active),
+            max(filtered[i][1][1] for i in active),
+        )
+
+        parts = self._call_all(
+            "score", request_id, query, final_score_range, top_k, shards=active
+        )
+        merged = {
+            name: np.concatenate([part[name] for part in parts]) for name in RANKED_FIELDS
+        }
+        order = np.argsort(-merged["hybrid_score"], kind="stable")[:top_k]
+        return {name: values[order] for name, values in merged.items()}
+
+    def _call_all(self, method: str, *args, shards: Optional[List[int]] = None) -> List[Any]:
+        shards = range(len(self.shards)) if shards is None else shards
+        futures = [
+            self._executor.submit(self.shards[i].call, method, *args) for i in shards
+        ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        for process in self.processes:
+            if process is not None:
+                process.terminate()
+        self._executor.shutdown(wait=False)
+
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def check(shards: int, queries: int, top_k: int):
+    # Runs the same searches sharded and in one process and compares them
+    config = Config()
+    config.EMBEDDING_CACHE_FILE = None
+    sharded = ShardedSearch.start_local(config, shards)
+    catalog = Catalog.load(config)
+    sharded.connect(catalog, config.SHARD_CONNECT_TIMEOUT_SECONDS)
+
+    movie_filter = MovieFilter()
+    similarity_calc = SimilarityCalculator(None, config)
+    rng = np.random.default_rng(0)
+    qualities = list(QUALITY_LEVELS)
+    mismatches = 0
+    single_seconds = sharded_seconds = 0.0
+    try:
+        for i in range(queries):
+            # A catalog row's own embedding stands in for an encoded query
+            query = np.array(catalog.embeddings[rng.integers(len(catalog))], dtype=np.float32)
+            low = int(rng.integers(1920, 2015))
+            features = Features(
+                movie_or_series=["movie", "tvSeries", "both"][i % 3],
+                genres=[],
+                negative_genres=[],
+                quality_level=qualities[i % len(qualities)],
+                positive_themes="check",
+                negative_themes=None,
+                date_range=[low, low + int(rng.integers(5, 40))] if i % 2 else [1900, 2025],
+                country_of_origin=[],
+                dont_wanted_countrys=[],
+                prompt_title="check",
+            )
+
+            start = time.perf_counter()
+            candidate_indices = movie_filter.apply_filters(catalog, features)
+            expected = empty_ranked()
+            if len(candidate_indices):
+                scored = similarity_calc.score_candidates(
+                    torch.from_numpy(query),
+                    features,
+                    catalog,
+                    candidate_indices,
+                    movie_filter.genre_scores(catalog, features, candidate_indices),
+                    top_k,
+                )
+                expected = similarity_calc.select_top_k(catalog, scored, top_k)
+            single_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = sharded.search(features, query, top_k)
+            sharded_seconds += time.perf_counter() - start
+
+            same = np.array_equal(np.sort(expected["row"]), np.sort(found["row"])) and np.allclose(
+                np.sort(expected["hybrid_score"]), np.sort(found["hybrid_score"]), atol=1e-6
+            )
+            if not same:
+                mismatches += 1
+                print(f"Query {i}: sharded top-{top_k} differs from the single-process one")
+    finally:
+        sharded.close()
+
+    print(
+        f"{queries} queries over {len(catalog)} rows: single process "
+        f"{1000 * single_seconds / queries:.1f} ms/query, {shards} shards "
+        f"{1000 * sharded_seconds / queries:.1f} ms/query, {mismatches} mismatches"
+    )
+    if mismatches:
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a catalog shard worker, or check sharded search against a single process."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Serve one shard of the catalog")
+    worker.add_argument("--shard", type=int, required=True)
+    worker.add_argument("--shards", type=int, required=True)
+    worker.add_argument("--host", default="0.0.0.0")
+    worker.add_argument("--port", type=int, required=True)
+    worker.add_argument("--threads", type=int, default=0)
+    check_parser = commands.add_parser(
+        "check", help="Start local shards and compare their results with one process"
+    )
+    check_parser.add_argument("--shards", type=int, default=4)
+    check_parser.add_argument("--queries", type=int, default=50)
+    check_parser.add_argument("--top-k", type=int, default=40)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        authkey = Config.SHARD_AUTHKEY
+        if not authkey:
+            raise SystemExit("Set SHARD_AUTHKEY; the coordinator must use the same key")
+        run_shard(
+            args.shard,
+            args.shards,
+            (args.host, args.port),
+            authkey.encode(),
+            threads=args.threads,
+        )
+        return
+    check(args.shards, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
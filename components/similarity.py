@@ -1,15 +1,179 @@
 import torch
 import numpy as np
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
-from config import QUALITY_LEVELS
+import hashlib
+from config import Config, QUALITY_LEVELS
+from components.cache import TieredCache
+from components.batcher import EmbeddingBatcher
+from components.telemetry import telemetry
+from models.catalog import Catalog
+from models.pydantic_schemas import Features
+
+# Result field -> catalog column
+RESULT_COLUMNS = {
+    "tconst": "tconst",
+    "title": "primaryTitle",
+    "type": "titleType",
+    "year": "startYear",
+    "rating": "averageRating",
+    "runtimeMinutes": "runtimeMinutes",
+    "votes": "numVotes",
+    "genres": "genres",
+    "overview": "overview",
+    "final_score": "finalScore",
+    "poster_url": "poster_url",
+    "country_of_origin": "country_of_origin",
+}
+SCORE_COLUMNS = ["similarity_score", "hybrid_score", "genre_score"]
+# What identifies a ranking: catalog row ids, best first, and their scores
+RANKED_FIELDS = ["row"] + SCORE_COLUMNS
+
+
+def empty_results(catalog: Catalog) -> Dict[str, np.ndarray]:
+    ranked = {name: np.empty(0, dtype=np.float32) for name in SCORE_COLUMNS}
+    ranked["row"] = np.empty(0, dtype=np.int64)
+    return ranked_results(catalog, ranked)
+
+
+def ranked_results(catalog: Catalog, ranked: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # One take per column; scores stay numeric until the API serializes them
+    results = catalog.take(ranked["row"], RESULT_COLUMNS)
+    results.update(ranked)
+    return results
+
+
+def result_count(results: Dict[str, np.ndarray]) -> int:
+    return len(results["tconst"])
 
 
 class SimilarityCalculator:
-    def __init__(self, model: SentenceTransformer):
+    def __init__(
+        self,
+        model,
+        config: Optional[Config] = None,
+    ):
         self.model = model
+        self.config = config or Config()
+        # Concurrent requests share forward passes through the batcher
+        self.batcher = EmbeddingBatcher(
+            model,
+            max_batch_size=self.config.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=self.config.EMBED_BATCH_MAX_WAIT_MS,
+        )
+        # Theme text -> normalized embedding, shared by every request
+        self.embedding_cache = TieredCache(
+            self.config.EMBEDDING_CACHE_SIZE,
+            path=self.config.EMBEDDING_CACHE_FILE,
+            max_disk_rows=self.config.EMBEDDING_CACHE_MAX_ROWS,
+        )
+
+    def warm_up(self, catalog: Catalog):
+        # The first forward pass and first scoring call pay one-off costs
+        # (weight paging, allocator and kernel setup); pay them before serving.
+        # Goes around the embedding cache so nothing is stored.
+        query_embedding = torch.from_numpy(self.batcher.encode(["warm-up query"])[0])
+        candidate_indices = np.arange(min(len(catalog), 2 * self.config.RERANK_WIDTH))
+        features = Features(
+            movie_or_series="both",
+            genres=[],
+            negative_genres=[],
+            positive_themes="warm-up query",
+            negative_themes=None,
+            date_range=[1900, 2025],
+            country_of_origin=[],
+            dont_wanted_countrys=[],
+            prompt_title="warm-up",
+        )
+        scored = self.score_candidates(
+            query_embedding,
+            features,
+            catalog,
+            candidate_indices,
+            np.zeros(len(candidate_indices), dtype=np.float32),
+        )
+        self.select_top_k(catalog, scored)
+
+    def build_query_embedding(self, features: Features) -> torch.Tensor:
+        return self.build_query_embeddings([features])[0]
+
+    def build_query_embeddings(self, features_list: List[Features]) -> torch.Tensor:
+        # (Q, D) query embeddings; the themes of every query, positive and
+        # negative, share one encode call on a cache miss
+        theme_lists = []
+        for features in features_list:
+            positive_themes = self._theme_list(features.positive_themes)
+            negative_themes = self._theme_list(features.negative_themes)
+            if not positive_themes:
+                raise ValueError("Features has no positive_themes to search for")
+            theme_lists.append((positive_themes, negative_themes))
+
+        themes = [theme for positive, negative in theme_lists for theme in positive + negative]
+        with telemetry.span("encode", themes=len(themes)):
+            theme_embeddings = torch.from_numpy(self.encode_themes(themes))
+
+        query_embeddings = []
+        offset = 0
+        for positive_themes, negative_themes in theme_lists:
+            positive_end = offset + len(positive_themes)
+            negative_end = positive_end + len(negative_themes)
+            avg_positive = torch.mean(theme_embeddings[offset:positive_end], dim=0)
+
+            if negative_themes:
+                avg_negative = torch.mean(theme_embeddings[positive_end:negative_end], dim=0)
+                positive_weight = 1.0
+                negative_influence = 0.6 # Setting this value to 1 is so harsh so I just used smaller value
+                combined_embedding = (positive_weight * avg_positive) - (
+                    negative_influence * avg_negative
+                )
+
+            else:
+                combined_embedding = avg_positive
+
+            query_embeddings.append(torch.nn.functional.normalize(combined_embedding, dim=0))
+            offset = negative_end
+
+        return torch.stack(query_embeddings)
+
+    def encode_themes(self, themes: List[str]) -> np.ndarray:
+        embeddings = [None] * len(themes)
+        missing = {}
+        for i, theme in enumerate(themes):
+            cached = self.embedding_cache.get(self._embedding_cache_key(theme))
+            if cached is not None:
+                embeddings[i] = np.frombuffer(cached, dtype=np.float32)
+            else:
+                missing.setdefault(theme, []).append(i)
+
+        telemetry.annotate(embedding_cache_misses=len(missing))
+        if missing:
+            encoded = self.batcher.encode(list(missing))
+            for theme, embedding in zip(missing, encoded):
+                self.embedding_cache.set(
+                    self._embedding_cache_key(theme), embedding.tobytes()
+                )
+                for i in missing[theme]:
+                    embeddings[i] = embedding
+
+        return np.stack(embeddings)
+
+    def _embedding_cache_key(self, theme: str) -> str:
+        # Each encoder backend (and int8 quantization) has its own vectors;
+        # the disk tier outlives a backend switch
+        backend = self.config.ENCODER_BACKEND
+        if backend == "onnx-int8":
+            backend = f"{backend}/{self.config.ENCODER_QUANTIZATION}"
+        return hashlib.sha256(
+            f"{self.config.EMBEDDING_MODEL}\n{backend}\n{theme}".encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _theme_list(themes) -> List[str]:
+        if not themes:
+            return []
+        if isinstance(themes, str):
+            return [themes]
+        return list(themes)
 
     def combined_and_score(self, similarity_matrix, alpha=10):
 
@@ -17,139 +181,310 @@ class SimilarityCalculator:
         return smooth_min
 
     def calculate_similarity(
-        self, features: str, filtered_data: pd.DataFrame, top_k: int = 40
+        self,
+        features: Features,
+        catalog: Catalog,
+        candidate_indices: np.ndarray,
+        genre_scores: np.ndarray,
+        top_k: int = 40,
     ) -> Dict[str, Any]:
-        if filtered_data.empty:
+        if len(candidate_indices) == 0:
             return {
                 "status": "No results found with current filters.",
-                "results": [],
+                "results": empty_results(catalog),
                 "search_time": 0,
                 "total_candidates": 0,
             }
 
         start_time = time.time()
-        positive_themes = features.positive_themes
-        negative_themes = features.negative_themes
-
-        positive_query_embeddings_np = self.model.encode(
-            positive_themes, convert_to_numpy=True
-        )
+        query_embedding = self.build_query_embedding(features)
+        with telemetry.span("hybrid_score", candidates=len(candidate_indices)):
+            scored = self.score_candidates(
+                query_embedding, features, catalog, candidate_indices, genre_scores, top_k
+            )
+        results = self.select_top_k(catalog, scored, top_k)
 
-        positive_query_embeddings = torch.tensor(
-            positive_query_embeddings_np, dtype=torch.float32
-        )
+        end_time = time.time()
+        search_time = end_time - start_time
 
-        if (
-            positive_query_embeddings.dim() > 1
-            and positive_query_embeddings.shape[0] > 1
-        ):
-            avg_positive = torch.mean(positive_query_embeddings, dim=0, keepdim=True)
-        else:
-            avg_positive = positive_query_embeddings
-        document_embeddings = torch.tensor(
-            np.array(filtered_data["embedding"].tolist()), dtype=torch.float32
-        )
+        return {
+            "status": "Search completed successfully.",
+            "results": results,
+            "search_time": search_time,
+            "total_candidates": len(candidate_indices),
+            "query_embedding_shape": query_embedding.shape,
+        }
 
-        if negative_themes is not None and len(negative_themes) > 0:
+    def score_candidates(
+        self,
+        query_embedding: torch.Tensor,
+        features: Features,
+        catalog: Catalog,
+        candidate_indices: np.ndarray,
+        genre_scores: np.ndarray,
+        top_k: int = 40,
+        final_score_range: Optional[tuple] = None,
+    ) -> Dict[str, Any]:
+        # A shard passes the finalScore range of the whole filtered set,
+        # gathered from every shard, in final_score_range
+        quality_config = QUALITY_LEVELS.get(features.quality_level, {})
+        rating_weight = quality_config.get("rating_weight")
 
-            negative_query_embeddings_np = self.model.encode(
-                negative_themes, convert_to_numpy=True
+        positions = self._ann_candidates(
+            query_embedding.numpy(), catalog, candidate_indices, top_k
+        )
+        if positions is None:
+            positions = self._first_pass_candidates(
+                query_embedding.numpy(),
+                catalog,
+                candidate_indices,
+                genre_scores,
+                rating_weight,
+                top_k,
             )
-            negative_query_embeddings = torch.tensor(
-                negative_query_embeddings_np, dtype=torch.float32
+        if final_score_range is None and len(candidate_indices) == len(catalog):
+            # Unfiltered query: the range was computed when the catalog loaded
+            final_score_range = catalog.final_score_bounds
+        elif final_score_range is None and positions is not None:
+            # finalScore is still normalized over the whole filtered set, so ANN
+            # and the first pass only change which rows get scored, not how
+            # they are scored.
+            candidate_final_scores = catalog.final_score[candidate_indices]
+            final_score_range = (
+                candidate_final_scores.min(),
+                candidate_final_scores.max(),
             )
+        if positions is not None:
+            candidate_indices = candidate_indices[positions]
+            genre_scores = genre_scores[positions]
 
-            if (
-                negative_query_embeddings.dim() > 1
-                and negative_query_embeddings.shape[0] > 1
-            ):
-                avg_negative = torch.mean(
-                    negative_query_embeddings, dim=0, keepdim=True
-                )
-            else:
-                avg_negative = negative_query_embeddings
-            positive_weight = 1.0
-            negative_influence = 0.6 # Setting this value to 1 is so harsh so I just used smaller value
-            combined_embedding = (positive_weight * avg_positive) - (
-                negative_influence * avg_negative
-            )
+        document_embeddings = torch.from_numpy(catalog.embeddings[candidate_indices])
+        similarities = document_embeddings @ query_embedding
+        return self._scored(
+            similarities,
+            catalog,
+            candidate_indices,
+            genre_scores,
+            rating_weight,
+            final_score_range,
+        )
 
-        else:
-            combined_embedding = avg_positive
+    def rank_batch(
+        self,
+        query_embeddings: torch.Tensor,
+        features_list: List[Features],
+        catalog: Catalog,
+        candidate_lists: List[np.ndarray],
+        genre_score_lists: List[np.ndarray],
+        top_k: int = 40,
+    ) -> List[Dict[str, np.ndarray]]:
+        # Exact hybrid ranking for many queries at once. ANN and the first
+        # pass are per-query shortcuts and are not used here: the shared
+        # block matmul already touches each catalog row once per batch.
+        similarity_lists = self.batch_similarities(
+            query_embeddings.numpy(), catalog, candidate_lists
+        )
+        results = []
+        for features, candidate_indices, genre_scores, similarities in zip(
+            features_list, candidate_lists, genre_score_lists, similarity_lists
+        ):
+            if len(candidate_indices) == 0:
+                results.append(empty_results(catalog))
+                continue
+            quality_config = QUALITY_LEVELS.get(features.quality_level, {})
+            final_score_range = None
+            if len(candidate_indices) == len(catalog):
+                final_score_range = catalog.final_score_bounds
+            scored = self._scored(
+                torch.from_numpy(similarities),
+                catalog,
+                candidate_indices,
+                genre_scores,
+                quality_config.get("rating_weight"),
+                final_score_range,
+            )
+            results.append(self.select_top_k(catalog, scored, top_k))
+        return results
 
-        similarities = self.model.similarity(combined_embedding, document_embeddings)
-        similarities = similarities[0]
+    def batch_similarities(
+        self,
+        queries: np.ndarray,
+        catalog: Catalog,
+        candidate_lists: List[np.ndarray],
+    ) -> List[np.ndarray]:
+        # Similarity of each query to each of its (sorted) candidate rows.
+        # The catalog is read in blocks of BATCH_BLOCK_ROWS; each block is
+        # multiplied by every query with rows in it in one (B, D) x (D, Q)
+        # matmul, and blocks no query needs are skipped.
+        similarities = [np.empty(len(c), dtype=np.float32) for c in candidate_lists]
+        block_rows = self.config.BATCH_BLOCK_ROWS
+        for start in range(0, len(catalog), block_rows):
+            end = min(start + block_rows, len(catalog))
+            spans = [
+                (np.searchsorted(c, start), np.searchsorted(c, end))
+                for c in candidate_lists
+            ]
+            active = [q for q, (lo, hi) in enumerate(spans) if lo < hi]
+            if not active:
+                continue
+            block = np.asarray(catalog.embeddings[start:end], dtype=np.float32)
+            block_scores = block @ queries[active].T
+            for column, q in enumerate(active):
+                lo, hi = spans[q]
+                rows = candidate_lists[q][lo:hi] - start
+                similarities[q][lo:hi] = block_scores[rows, column]
+        return similarities
 
-        quality_config = QUALITY_LEVELS.get(features.quality_level, {})
-        rating_weight = quality_config.get("rating_weight")
+    def _scored(
+        self,
+        similarities: torch.Tensor,
+        catalog: Catalog,
+        candidate_indices: np.ndarray,
+        genre_scores: np.ndarray,
+        rating_weight: float,
+        final_score_range: Optional[tuple],
+    ) -> Dict[str, Any]:
         hybrid_scores = self._calculate_hybrid_score(
             similarities,
-            filtered_data,
+            catalog.final_score[candidate_indices],
+            genre_scores,
             similarity_weight=1,
             rating_weight=rating_weight,
             genre_weight=0.3,
+            final_score_range=final_score_range,
         )
+        return {
+            "indices": candidate_indices,
+            "similarities": similarities,
+            "hybrid_scores": hybrid_scores,
+            "genre_scores": genre_scores,
+        }
 
-        top_indices = (
-            torch.topk(hybrid_scores, min(top_k, len(hybrid_scores)))
-            .indices.cpu()
-            .numpy()
-        )
-        results = []
-        for idx in top_indices:
-            row = filtered_data.iloc[idx]
-
-            result = {
-                "tconst": row["tconst"],
-                "title": row["primaryTitle"],
-                "type": row["titleType"],
-                "year": row["startYear"],
-                "rating": row["averageRating"],
-                "runtimeMinutes": row.get("runtimeMinutes", None),
-                "votes": row["numVotes"],
-                "genres": row["genres"],
-                "overview": row["overview"],
-                "similarity_score": float(similarities[idx]),
-                "hybrid_score": float(hybrid_scores[idx]),
-                "final_score": row["finalScore"],
-                "genre_score": row["genreScore"],
-                "poster_url": row["poster_url"],
-                "country_of_origin": row["country_of_origin"],
-            }
-            results.append(result)
+    def select_top_k(
+        self, catalog: Catalog, scored: Dict[str, Any], top_k: int = 40
+    ) -> Dict[str, np.ndarray]:
+        hybrid_scores = scored["hybrid_scores"]
+        with telemetry.span("top_k"):
+            top_indices = (
+                torch.topk(hybrid_scores, min(top_k, len(hybrid_scores)))
+                .indices.cpu()
+                .numpy()
+            )
+        with telemetry.span("results"):
+            return ranked_results(
+                catalog,
+                {
+                    "row": scored["indices"][top_indices],
+                    "similarity_score": scored["similarities"].numpy()[top_indices],
+                    "hybrid_score": hybrid_scores.numpy()[top_indices],
+                    "genre_score": scored["genre_scores"][top_indices],
+                },
+            )
 
-        end_time = time.time()
-        search_time = end_time - start_time
+    def prerank(
+        self, query_embedding: torch.Tensor, catalog: Catalog, width: int
+    ) -> np.ndarray:
+        # Sorted row ids of the `width` rows closest to the query, ignoring
+        # every filter
+        query = query_embedding.numpy()
+        width = min(width, len(catalog))
+        if catalog.ann_index is not None:
+            ids, _ = catalog.ann_index.search(
+                query, catalog.embeddings, width, n_probe=self.config.ANN_N_PROBE
+            )
+            if len(ids) == width:
+                return np.sort(ids)
 
-        return {
-            "status": "Search completed successfully.",
-            "results": results,
-            "search_time": search_time,
-            "total_candidates": len(filtered_data),
-            "query_embedding_shape": combined_embedding.shape,
-        }
+        similarities = catalog.embeddings @ query
+        return np.sort(np.argpartition(-similarities, width - 1)[:width])
+
+    def _first_pass_candidates(
+        self,
+        query: np.ndarray,
+        catalog: Catalog,
+        candidate_indices: np.ndarray,
+        genre_scores: np.ndarray,
+        rating_weight: float,
+        top_k: int,
+    ) -> Optional[np.ndarray]:
+        # Ranks every candidate on the compact embeddings and returns the
+        # positions of the best RERANK_WIDTH, or None to score them all exactly.
+        if catalog.compact is None:
+            return None
+        width = max(self.config.RERANK_WIDTH, top_k)
+        if len(candidate_indices) <= width:
+            return None
+
+        with telemetry.span("first_pass", candidates=len(candidate_indices)):
+            approximate = torch.from_numpy(
+                catalog.compact.scores(query, candidate_indices)
+            )
+            approximate_scores = self._calculate_hybrid_score(
+                approximate,
+                catalog.final_score[candidate_indices],
+                genre_scores,
+                similarity_weight=1,
+                rating_weight=rating_weight,
+                genre_weight=0.3,
+            )
+            positions = torch.topk(approximate_scores, width).indices.numpy()
+        return np.sort(positions)
+
+    def _ann_candidates(
+        self,
+        query: np.ndarray,
+        catalog: Catalog,
+        candidate_indices: np.ndarray,
+        top_k: int,
+    ) -> Optional[np.ndarray]:
+        # Returns positions into candidate_indices, or None to scan them all.
+        if catalog.ann_index is None:
+            return None
+
+        # Very selective filters leave few rows; scanning them exactly is both
+        # cheaper and lossless.
+        if len(candidate_indices) < self.config.ANN_MIN_SELECTIVITY * len(catalog):
+            return None
+
+        allowed = np.zeros(len(catalog), dtype=bool)
+        allowed[candidate_indices] = True
+        ann_ids, _ = catalog.ann_index.search(
+            query,
+            catalog.embeddings,
+            top_k * self.config.ANN_OVERFETCH,
+            n_probe=self.config.ANN_N_PROBE,
+            allowed=allowed,
+        )
+        if len(ann_ids) < top_k:
+            return None
+        return np.searchsorted(candidate_indices, ann_ids)
 
     def _calculate_hybrid_score(
         self,
         similarities: torch.Tensor,
-        data: pd.DataFrame,
+        final_scores: np.ndarray,
+        genre_scores: np.ndarray,
         similarity_weight: float = 1,
         rating_weight: float = 0.1,
         genre_weight: float = 0.3,
+        final_score_range: Optional[tuple] = None,
     ) -> torch.Tensor:
 
-        if "finalScore" in data.columns:
-            final_scores = torch.tensor(data["finalScore"].values, dtype=torch.float32)
-            genre_score = torch.tensor(data["genreScore"].values, dtype=torch.float32)
-            final_normalized = (final_scores - final_scores.min()) / (
-                final_scores.max() - final_scores.min() + 1e-8
-            )
+        final_scores = torch.from_numpy(final_scores)
+        genre_score = torch.from_numpy(genre_scores)
+        if final_score_range is None:
+            final_min, final_max = final_scores.min(), final_scores.max()
+        else:
+            final_min, final_max = final_score_range
+        final_normalized = (final_scores - final_min) / (
+            final_max - final_min + 1e-8
+        )
 
-            total_weight = similarity_weight + rating_weight + genre_weight
-            hybrid_score = (
-                similarity_weight * similarities
-                + rating_weight * final_normalized
-                + genre_weight * genre_score
-            ) / total_weight
+        total_weight = similarity_weight + rating_weight + genre_weight
+        hybrid_score = (
+            similarity_weight * similarities
+            + rating_weight * final_normalized
+            + genre_weight * genre_score
+        ) / total_weight
 
         return hybrid_score
@@ -0,0 +1,211 @@
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+DURATION_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")]
+COUNT_BUCKETS = [0, 10, 100, 1000, 10000, 100000, 1000000, float("inf")]
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class _Span:
+    def __init__(self, telemetry: "Telemetry", name: str, attrs: Dict[str, Any]):
+        self.telemetry = telemetry
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.telemetry.observe("stage_seconds", duration, stage=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            span = {"name": self.name, "ms": round(1000 * duration, 3)}
+            if self.attrs:
+                span.update(self.attrs)
+            if exc_type is not None:
+                span["error"] = exc_type.__name__
+            trace["spans"].append(span)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _Trace:
+    def __init__(self, telemetry: "Telemetry", name: str, attrs: Dict[str, Any]):
+        self.telemetry = telemetry
+        self.record = {"name": name, "spans": [], **attrs}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.token = _current_trace.set(self.record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self.token)
+        duration = time.perf_counter() - self.start
+        self.telemetry.observe("request_seconds", duration, trace=self.record["name"])
+        self.record["ms"] = round(1000 * duration, 3)
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        self.telemetry.write_trace(self.record)
+        return False
+
+    def set(self, **attrs):
+        self.record.update(attrs)
+
+
+class Telemetry:
+    # Span timings, counters and histograms for the recommendation pipeline.
+    # When disabled every call returns immediately (spans are a shared no-op
+    # object), so instrumented code pays one attribute check per call site.
+
+    def __init__(self, enabled: bool = False, jsonl_path: Optional[str] = None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._collectors = []
+
+    def configure(self, enabled: bool, jsonl_path: Optional[str] = None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, attrs)
+
+    def trace(self, name: str, **attrs):
+        # Groups the spans of one request; written as a JSON line on exit
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Trace(self, name, attrs)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, buckets: List[float] = None, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(
+                    buckets or DURATION_BUCKETS
+                )
+            histogram.observe(value)
+
+    def annotate(self, **attrs):
+        # Adds attributes to the current request trace, if any
+        if not self.enabled:
+            return
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.update(attrs)
+
+    def register_collector(self, collector: Callable[[], Dict[Tuple[str, tuple], float]]):
+        # Collectors are polled at scrape time for values owned elsewhere,
+        # such as cache hit counters.
+        self._collectors.append(collector)
+
+    def write_trace(self, record: Dict[str, Any]):
+        if not self.jsonl_path:
+            return
+        record["ts"] = time.time()
+        record["rss_mb"] = round(_rss_mb(), 1)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.jsonl_path, "a") as f:
+                f.write(line + "\n")
+
+    def render_prometheus(self, prefix: str = "cinesearch") -> str:
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(h.buckets), list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+
+        gauges = {("process_resident_memory_bytes", ()): _rss_mb() * 1024 * 1024}
+        for collector in self._collectors:
+            gauges.update(collector())
+
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{prefix}_{name}_total{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(gauges.items()):
+            lines.append(f"{prefix}_{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f"{prefix}_{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}"
+                )
+            lines.append(f"{prefix}_{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{prefix}_{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels: Dict[str, Any]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+# Process-wide instance; configured from Config at engine startup
+telemetry = Telemetry()
@@ -222,8 +222,139 @@ QUALITY_LEVELS = {
 
 class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    LLM_MODEL = "gpt-4o"
     EMBEDDING_MODEL = "Qwen/Qwen3-Embedding-0.6B"
+    # Query encoder: "torch" (eager), "compiled" (torch.compile), "onnx" or
+    # "onnx-int8" (ONNX Runtime, needs `pip install sentence-transformers[onnx]`).
+    # ENCODER_THREADS=0 keeps the library's default thread count.
+    ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+    ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", 0))
+    ENCODER_QUANTIZATION = os.getenv("ENCODER_QUANTIZATION", "avx512_vnni")
+    ENCODER_ONNX_DIR = "data/onnx_encoder"
     DATA_FILE = "data/demo_data.parquet"
+    # Built with `python -m components.embedding_store DATA_FILE EMBEDDING_FILE`
+    EMBEDDING_FILE = "data/demo_embeddings.npy"
+    # Serving bundle built with
+    # `python -m components.catalog_bundle build DATA_FILE CATALOG_BUNDLE_DIR`;
+    # loaded instead of DATA_FILE and EMBEDDING_FILE when present
+    CATALOG_BUNDLE_DIR = os.getenv("CATALOG_BUNDLE_DIR", "data/catalog_bundle")
+
+    # "exact" scans every filtered row, "ann" probes the IVF index built with
+    # `python -m components.ann_index EMBEDDING_FILE ANN_INDEX_FILE`
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "exact")
+    ANN_INDEX_FILE = "data/demo_ann_index.npz"
+    ANN_N_PROBE = 8
+    ANN_OVERFETCH = 10
+    # Below this fraction of the catalog surviving the filters, use the exact scan
+    ANN_MIN_SELECTIVITY = 0.05
+
+    # Parsed Features cache: in-process LRU backed by SQLite, keyed on the
+    # normalized query, LLM_MODEL and a hash of the system prompt
+    PARSE_CACHE_SIZE = 1024
+    PARSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+    PARSE_CACHE_FILE = (
+        os.getenv("PARSE_CACHE_FILE", "data/cache/parse_cache.sqlite") or None
+    )
+    # Oldest rows beyond this are pruned from the SQLite file
+    PARSE_CACHE_MAX_ROWS = 100000
+
+    # Ranked rows and scores by canonical Features, top_k and catalog version,
+    # bounded by entry count and by the bytes of the stored arrays
+    RESULT_CACHE_SIZE = 4096
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", 64)) * 1024 * 1024
+
+    # Paginated search: the first page ranks PAGINATION_DEPTH rows and keeps
+    # them under a cursor; later pages are slices of that ranking, and a page
+    # past its end ranks twice as deep from the cursor's cached Features
+    PAGINATION_DEPTH = 200
+    PAGINATION_MAX_PAGE_SIZE = 100
+    CURSOR_CACHE_SIZE = 10000
+    CURSOR_TTL_SECONDS = int(os.getenv("CURSOR_TTL_SECONDS", 15 * 60))
+    CURSOR_CACHE_MAX_BYTES = int(os.getenv("CURSOR_CACHE_MAX_MB", 32)) * 1024 * 1024
+
+    # Rows matching each filter predicate (title type group, year range,
+    # quality level, runtime bounds, country) are kept as compressed bitmaps
+    # and AND/OR/ANDNOT-ed per request instead of re-scanning the columns
+    FILTER_BITMAP_CACHE = os.getenv("FILTER_BITMAP_CACHE", "1") == "1"
+    FILTER_BITMAP_CACHE_SIZE = 1024
+    FILTER_BITMAP_CACHE_MAX_BYTES = (
+        int(os.getenv("FILTER_BITMAP_CACHE_MAX_MB", 32)) * 1024 * 1024
+    )
+
+    # Theme text -> normalized query embedding; set the file to "" for memory only
+    EMBEDDING_CACHE_SIZE = 4096
+    EMBEDDING_CACHE_FILE = (
+        os.getenv("EMBEDDING_CACHE_FILE", "data/cache/embedding_cache.sqlite") or None
+    )
+    # About 4 KB per row at 1024 dims
+    EMBEDDING_CACHE_MAX_ROWS = 50000
+
+    # Theme encodes from concurrent requests are coalesced into one forward
+    # pass of up to EMBED_BATCH_MAX_SIZE texts, waiting at most this long
+    EMBED_BATCH_MAX_SIZE = 32
+    EMBED_BATCH_MAX_WAIT_MS = 5
+
+    # "int8" or "float16" keeps a compact copy of the embeddings for a first
+    # pass over the filtered rows; the best RERANK_WIDTH are re-scored in
+    # float32. With EMBEDDING_FILE present the float32 matrix stays on disk.
+    EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32")
+    # Truncates the first-pass copy to the leading dims (e.g. 128 or 256) of
+    # each Matryoshka embedding; 0 keeps every dim
+    FIRST_PASS_DIMS = int(os.getenv("FIRST_PASS_DIMS", 0))
+    RERANK_WIDTH = int(os.getenv("RERANK_WIDTH", 400))
+
+    # Per-stage spans and counters, scraped from /metrics; traces of each
+    # request are appended as JSON lines when TELEMETRY_JSONL_FILE is set
+    TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"
+    TELEMETRY_JSONL_FILE = os.getenv("TELEMETRY_JSONL_FILE") or None
+
+    # Async path: LLM calls share one pooled HTTP client, filtering and scoring
+    # run on SCORING_WORKERS threads, and requests beyond MAX_IN_FLIGHT are
+    # rejected immediately instead of queueing
+    LLM_MAX_CONNECTIONS = 32
+    LLM_MAX_KEEPALIVE_CONNECTIONS = 16
+    SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", min(4, os.cpu_count() or 1)))
+    MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 64))
+
+    # Sharded scoring: SHARD_WORKERS > 0 starts that many local worker
+    # processes, each filtering and scoring a contiguous slice of the catalog
+    # rows. SHARD_ADDRESSES ("host:port,...") uses workers started elsewhere
+    # with `python -m components.sharding worker` and the same SHARD_AUTHKEY.
+    SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 0))
+    SHARD_ADDRESSES = [
+        address for address in os.getenv("SHARD_ADDRESSES", "").split(",") if address
+    ]
+    SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", "")
+    SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 7900))
+    SHARD_CONNECT_TIMEOUT_SECONDS = 600
+    # Longest wait for one shard reply; a hung worker fails the request
+    # with TimeoutError instead of blocking its thread forever
+    SHARD_RPC_TIMEOUT_SECONDS = float(os.getenv("SHARD_RPC_TIMEOUT_SECONDS", 30))
+    SHARD_PENDING_SIZE = 1024
+
+    # Batch API: at most BATCH_MAX_QUERIES queries per call; scoring reads
+    # the catalog embeddings BATCH_BLOCK_ROWS rows at a time
+    BATCH_MAX_QUERIES = 256
+    BATCH_BLOCK_ROWS = 65536
+
+    # An LLM parse that fails or misses this deadline is replaced by the local
+    # keyword parser and the response is flagged as degraded
+    PARSE_DEADLINE_SECONDS = float(os.getenv("PARSE_DEADLINE_SECONDS", 8))
+
+    # Speculative mode encodes the raw query and pre-ranks the catalog while
+    # the LLM parse is in flight; on a degraded parse only the pre-ranked
+    # rows are scored
+    SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "0") == "1"
+    SPECULATIVE_PRERANK_SIZE = 2000
+
+    # Catalog deltas (new rows, rating/vote updates, removals) are applied to
+    # the running engine from JSON files dropped in CATALOG_DELTA_DIR, and
+    # through POST /catalog/delta when CATALOG_DELTA_API is on. Writers should
+    # create the file under another name (e.g. .json.tmp) and rename it into
+    # place, so the watcher never reads a half-written delta
+    CATALOG_DELTA_DIR = os.getenv("CATALOG_DELTA_DIR") or None
+    CATALOG_DELTA_POLL_SECONDS = 5
+    CATALOG_DELTA_API = os.getenv("CATALOG_DELTA_API", "0") == "1"
 
     THEME = "soft"
     TITLE = "AI Movie & TV Series Recommender"
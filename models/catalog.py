@@ -0,0 +1,216 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Optional, get_args
+from config import Config, GENRE_LIST, COUNTRY_LIST
+from components.bitsets import TokenBitset
+from components.quantization import CompactEmbeddings
+from components.embedding_store import (
+    build_embedding_matrix,
+    embedding_store_matches,
+    load_embedding_store,
+    read_catalog_metadata,
+)
+from components.catalog_bundle import bundle_exists, read_bundle
+
+
+class Catalog:
+    # Everything a query reads, prepared once at load time: the scalar
+    # metadata, the normalized embedding matrix and typed NumPy columns for
+    # filtering and scoring. Row i of every array is row i of `data`.
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        embeddings: np.ndarray,
+        columns: Optional[Dict[str, Any]] = None,
+    ):
+        self.data = data.reset_index(drop=True)
+        self.embeddings = embeddings
+        # Optional low-precision copy for first-pass scoring
+        self.compact = None
+        # Optional IVFIndex over `embeddings`, swapped in and out with them
+        self.ann_index = None
+        # Identifies the loaded catalog contents: the bundle version, or one
+        # derived from the parquet file; catalog deltas give it a new one
+        self.version = None
+
+        # A serving bundle hands over columns that were typed at build time
+        if columns is None:
+            columns = typed_columns(self.data)
+        self.title_types = columns["title_types"]
+        self.start_year = columns["start_year"]
+        self.average_rating = columns["average_rating"]
+        self.num_votes = columns["num_votes"]
+        self.runtime_minutes = columns["runtime_minutes"]
+        self.final_score = columns["final_score"]
+        self.genres = columns["genres"]
+        self.countries = columns["countries"]
+        # Catalog-wide finalScore range, the normalization range of an
+        # unfiltered query
+        self.final_score_bounds = columns.get("final_score_bounds") or (
+            _bounds(self.final_score)
+        )
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def shard(self, start: int, stop: int) -> "Catalog":
+        # Rows [start, stop) as a catalog of their own, for a shard worker.
+        # Everything is copied so the full catalog can be freed; memory-mapped
+        # embeddings stay a slice of the map, which costs no RAM.
+        rows = np.arange(start, stop)
+        columns = {
+            "title_types": self.title_types[rows],
+            "start_year": self.start_year[rows],
+            "average_rating": self.average_rating[rows],
+            "num_votes": self.num_votes[rows],
+            "runtime_minutes": self.runtime_minutes[rows],
+            "final_score": self.final_score[rows],
+            "genres": self.genres.take(rows),
+            "countries": self.countries.take(rows),
+        }
+        if isinstance(self.embeddings, np.memmap):
+            embeddings = self.embeddings[start:stop]
+        else:
+            embeddings = self.embeddings[rows]
+        shard = Catalog(self.data.iloc[start:stop].copy(), embeddings, columns)
+        shard.version = self.version
+        return shard
+
+    def take(self, rows: np.ndarray, columns: Dict[str, str]) -> Dict[str, np.ndarray]:
+        # Gathers `rows` from each catalog column into {field: array}. Columns
+        # missing from the parquet come back as None.
+        taken = {}
+        for field, column in columns.items():
+            if column in self.data.columns:
+                taken[field] = self.data[column].to_numpy()[rows]
+            else:
+                taken[field] = np.full(len(rows), None, dtype=object)
+        return taken
+
+    def title_type_mask(self, title_types: list) -> np.ndarray:
+        codes = [
+            code
+            for code, title_type in enumerate(self.title_types.categories)
+            if title_type in title_types
+        ]
+        return np.isin(self.title_types.codes, codes)
+
+    @classmethod
+    def load(cls, config: Config) -> "Catalog":
+        catalog = cls._load(config)
+        if catalog.version is None:
+            catalog.version = _file_version(config.DATA_FILE)
+        if config.EMBEDDING_STORAGE != "float32" or config.FIRST_PASS_DIMS:
+            catalog.compact = CompactEmbeddings.build(
+                catalog.embeddings,
+                config.EMBEDDING_STORAGE,
+                dims=config.FIRST_PASS_DIMS or None,
+            )
+            print(
+                f"Built {catalog.compact.storage} first-pass embeddings with "
+                f"{catalog.compact.codes.shape[1]} dims "
+                f"({catalog.compact.nbytes / 1024 / 1024:.0f} MB)"
+            )
+        return catalog
+
+    @classmethod
+    def from_bundle(cls, path: str) -> "Catalog":
+        data, embeddings, columns, manifest = read_bundle(path)
+        catalog = cls(data, embeddings, columns)
+        catalog.version = manifest["version"]
+        return catalog
+
+    @classmethod
+    def _load(cls, config: Config) -> "Catalog":
+        if bundle_exists(config.CATALOG_BUNDLE_DIR):
+            catalog = cls.from_bundle(config.CATALOG_BUNDLE_DIR)
+            print(
+                f"Loaded catalog bundle {catalog.version} from "
+                f"{config.CATALOG_BUNDLE_DIR}"
+            )
+            return catalog
+
+        if os.path.exists(config.EMBEDDING_FILE):
+            data = read_catalog_metadata(config.DATA_FILE)
+            embeddings = load_embedding_store(config.EMBEDDING_FILE)
+            # A row count can survive a replaced or re-sorted parquet; the
+            # recorded tconst order cannot
+            if len(embeddings) == len(data) and embedding_store_matches(
+                config.EMBEDDING_FILE, data
+            ):
+                print(f"Memory-mapped embeddings from {config.EMBEDDING_FILE}")
+                return cls(data, embeddings)
+            print(
+                f"Embedding store {config.EMBEDDING_FILE} was not written from "
+                f"the current {config.DATA_FILE}, rebuilding from it"
+            )
+
+        data = pd.read_parquet(config.DATA_FILE)
+        embeddings = build_embedding_matrix(data.pop("embedding"))
+        return cls(data, embeddings)
+
+
+# Parquet columns typed_columns reads; every catalog row needs them
+TYPED_SOURCE_COLUMNS = [
+    "titleType",
+    "startYear",
+    "averageRating",
+    "numVotes",
+    "runtimeMinutes",
+    "finalScore",
+    "genres",
+    "country_of_origin",
+]
+
+
+def typed_columns(
+    data: pd.DataFrame,
+    genre_vocabulary=get_args(GENRE_LIST),
+    country_vocabulary=get_args(COUNTRY_LIST),
+) -> Dict[str, Any]:
+    # The string columns parsed into the arrays filtering and scoring read.
+    # The bundle build calls this once per row group, passing the vocabulary
+    # seen so far so token ids stay the same across groups.
+    return {
+        "title_types": pd.Categorical(data["titleType"]),
+        "start_year": _to_int_column(data["startYear"], np.int16),
+        "average_rating": pd.to_numeric(
+            data["averageRating"], errors="coerce"
+        ).to_numpy(dtype=np.float32),
+        "num_votes": _to_int_column(data["numVotes"], np.int32),
+        "runtime_minutes": _to_int_column(data["runtimeMinutes"], np.int16),
+        "final_score": data["finalScore"].to_numpy(dtype=np.float32),
+        "genres": TokenBitset.from_strings(
+            data["genres"], genre_vocabulary, lowercase=True
+        ),
+        "countries": TokenBitset.from_strings(
+            data["country_of_origin"], country_vocabulary
+        ),
+    }
+
+
+def _file_version(path: str) -> str:
+    # Path, size and modification time; replacing the file changes it
+    stat = os.stat(path)
+    return hashlib.sha256(
+        f"{os.path.abspath(path)}\n{stat.st_size}\n{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+
+
+def _bounds(values: np.ndarray) -> tuple:
+    if len(values) == 0:
+        return (np.float32(0), np.float32(0))
+    return (values.min(), values.max())
+
+
+def _to_int_column(values: pd.Series, dtype) -> np.ndarray:
+    # Unparseable, missing and out-of-range values become -1, which no real
+    # year, vote count or runtime can take. Casting an out-of-range value
+    # would wrap it around instead (a 40000-minute runtime to -25536).
+    numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+    limits = np.iinfo(dtype)
+    numbers[~((numbers >= limits.min) & (numbers <= limits.max))] = -1
+    return numbers.astype(dtype)
@@ -1,13 +1,35 @@
-from sentence_transformers import SentenceTransformer
+import threading
 from config import Config
 
+_models = {}
+_models_lock = threading.RLock()
+
+
+def load_embedding_model(model_name: str):
+    # One SentenceTransformer per model name per process, shared by every
+    # caller. sentence_transformers is imported on first use, so startup can
+    # overlap its import and the model load with catalog loading. torch
+    # itself is already imported by the ranking modules.
+    def load():
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name, trust_remote_code=True)
+
+    return shared_model(model_name, load)
+
+
+def shared_model(key, factory):
+    # Builds the model for `key` once; concurrent callers wait for that build
+    with _models_lock:
+        if key not in _models:
+            _models[key] = factory()
+        return _models[key]
+
 
 class EmbeddingModel:
     def __init__(self):
         self.config = Config()
-        self.model = SentenceTransformer(
-            self.config.EMBEDDING_MODEL, trust_remote_code=True
-        )
+        self.model = load_embedding_model(self.config.EMBEDDING_MODEL)
 
     def encode(self, texts):
         return self.model.encode(texts, prompt="query")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Literal, Optional
-from config import GENRE_LIST, COUNTRY_LIST
+from typing import Any, Literal, Optional
+from config import Config, GENRE_LIST, COUNTRY_LIST
 
 
 class Features(BaseModel):
@@ -39,3 +39,30 @@ class Features(BaseModel):
         description="Unwanted country of production"
     )
     prompt_title: str = Field(description="A short and meaningful title for the prompt")
+
+
+class CatalogDelta(BaseModel):
+    added: list[dict[str, Any]] = Field(
+        default=[],
+        description="New catalog rows; a row whose tconst exists replaces it. Rows without an `embedding` get their overview encoded",
+    )
+    updated: list[dict[str, Any]] = Field(
+        default=[],
+        description="tconst plus new values for any of averageRating, numVotes, finalScore",
+    )
+    removed: list[str] = Field(default=[], description="tconst of rows to drop")
+
+
+class BatchRecommendationRequest(BaseModel):
+    queries: list[str] = Field(description="Natural-language queries, one result set each")
+    top_k: int = Field(default=40, ge=1, le=200, description="Results per query")
+
+
+class RecommendationPageRequest(BaseModel):
+    query: Optional[str] = Field(default=None, description="Query for the first page")
+    cursor: Optional[str] = Field(
+        default=None, description="next_cursor of the previous page; takes precedence over query"
+    )
+    page_size: int = Field(
+        default=40, ge=1, le=Config.PAGINATION_MAX_PAGE_SIZE, description="Results per page"
+    )
@@ -1,86 +1,41 @@
-import pandas as pd
+import asyncio
+import contextvars
+import httpx
+import json
+import numpy as np
+import threading
 import time
-from openai import OpenAI
+import os
+from concurrent.futures import ThreadPoolExecutor
+from openai import APITimeoutError, AsyncOpenAI, OpenAI
 from config import Config
-from models.pydantic_schemas import Features
-from components.similarity import SimilarityCalculator
+from models.pydantic_schemas import CatalogDelta, Features
+from components.similarity import (
+    RANKED_FIELDS,
+    SimilarityCalculator,
+    ranked_results,
+    result_count,
+)
 from components.filters import MovieFilter
-from sentence_transformers import SentenceTransformer
+from components.bitmaps import BitmapCache
+from components.ann_index import IVFIndex
+from components.catalog_updates import apply_delta
+from components.sharding import ShardedSearch
+from models.catalog import Catalog
+from components.cache import CursorStore, ResultCache, TieredCache
+from components.telemetry import telemetry
+from components.heuristic_parser import HeuristicParser
+from components.encoders import load_encoder
 import traceback
 import sys
+import hashlib
+import re
+from typing import List, Optional
 
+# Set when the current request was served from heuristically parsed features
+_degraded = contextvars.ContextVar("degraded", default=False)
 
-class RecommendationEngine:
-    def __init__(self):
-        self.config = Config()
-        self.model = SentenceTransformer(
-            self.config.EMBEDDING_MODEL, trust_remote_code=True
-        )
-        self.client = OpenAI(api_key=self.config.OPENAI_API_KEY)
-        self.data = pd.read_parquet(self.config.DATA_FILE)
-
-        self.similarity_calc = SimilarityCalculator(self.model)
-        self.filter = MovieFilter()
-
-    def get_recommendations(self, user_query: str, top_k: int = 40):
-        print(f"Starting recommendation process for query: '{user_query}'")
-        if not user_query.strip():
-            return "Please enter some text.", None
-
-        try:
-            start_time = time.time()
-            features = self._parse_user_query(user_query)
-            filtered_data = self.filter.apply_filters(self.data, features)
-
-            try:
-                search_results = self.similarity_calc.calculate_similarity(
-                    features, filtered_data, top_k
-                )
-            except Exception as similarity_error:
-                print(f"Error in similarity calculation: {str(similarity_error)}")
-                print(f"Traceback: {traceback.format_exc()}")
-
-                print("Attempting recovery with smaller dataset...")
-                if len(filtered_data) > 1000:
-                    smaller_data = filtered_data.sample(n=1000, random_state=42)
-                    search_results = self.similarity_calc.calculate_similarity(
-                        features, smaller_data, top_k
-                    )
-                    print("Recovery successful with smaller dataset")
-                else:
-                    raise similarity_error
-
-            print(f"Found {len(search_results['results'])} results.")
-
-            results_df = self._create_results_dataframe(search_results)
-            total_time = time.time() - start_time
-            print(f"Recommendation finished in {total_time:.4f} seconds")
-            return features.prompt_title, results_df
-
-        except Exception as e:
-            print(f"Critical error in recommendation process: {str(e)}")
-            print(f"Full traceback: {traceback.format_exc()}")
-            print(f"Exception type: {type(e).__name__}")
-
-            try:
-                import psutil
-
-                process = psutil.Process()
-                memory_usage = process.memory_info().rss / 1024 / 1024
-                print(f"Current memory usage: {memory_usage:.2f} MB")
-            except:
-                pass
-
-            return f"Error: {str(e)}", None
-
-    def _parse_user_query(self, query: str) -> Features:
-        try:
-            response = self.client.beta.chat.completions.parse(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an AI that converts natural language movie/TV preferences into structured features based on a predefined schema.
+SYSTEM_PROMPT = """You are an AI that converts natural language movie/TV preferences into structured features based on a predefined schema.
 
                                     Your output must strictly follow the `Features` schema. You do not need to re-define the field names; just ensure correct values are produced.
 
@@ -281,51 +236,844 @@ class RecommendationEngine:
 
                                     **NEVER leave `positive_themes` empty, if query pure nonsense then use most popular movie overview**
                                     **ALWAYS write themes as compelling movie/TV descriptions using franchise-specific context.**
-                                    """,
-                    },
-                    {"role": "user", "content": query},
-                ],
-                response_format=Features,
+                                    """
+
+
+class RecommendationEngine:
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        model=None,
+        client=None,
+        async_client=None,
+        defer_startup: bool = False,
+    ):
+        # model and client can be injected, e.g. by the offline benchmarks.
+        # With defer_startup the caller runs start() itself, typically on a
+        # background thread while the server already answers /health.
+        self.config = config or Config()
+        self.model = model
+        self.client = client or OpenAI(api_key=self.config.OPENAI_API_KEY)
+        self._async_client = async_client
+        self.parse_cache = TieredCache(
+            self.config.PARSE_CACHE_SIZE,
+            self.config.PARSE_CACHE_TTL_SECONDS,
+            self.config.PARSE_CACHE_FILE,
+            self.config.PARSE_CACHE_MAX_ROWS,
+        )
+        # Editing the prompt or switching models changes every cache key
+        self._parse_cache_namespace = hashlib.sha256(
+            f"{self.config.LLM_MODEL}\n{SYSTEM_PROMPT}".encode()
+        ).hexdigest()
+        self.result_cache = ResultCache(
+            self.config.RESULT_CACHE_SIZE, self.config.RESULT_CACHE_MAX_BYTES
+        )
+        self.cursors = CursorStore(
+            self.config.CURSOR_CACHE_SIZE,
+            self.config.CURSOR_TTL_SECONDS,
+            self.config.CURSOR_CACHE_MAX_BYTES,
+        )
+        self.bitmap_cache = None
+        if self.config.FILTER_BITMAP_CACHE:
+            self.bitmap_cache = BitmapCache(
+                self.config.FILTER_BITMAP_CACHE_SIZE,
+                self.config.FILTER_BITMAP_CACHE_MAX_BYTES,
+            )
+        self.filter = MovieFilter(self.bitmap_cache)
+        self.heuristic_parser = HeuristicParser()
+
+        # CPU-bound stages of the async path; sized so waiting on the LLM
+        # never holds one of these threads
+        self.scoring_executor = ThreadPoolExecutor(
+            max_workers=self.config.SCORING_WORKERS, thread_name_prefix="scoring"
+        )
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Catalog deltas are applied one at a time
+        self._update_lock = threading.Lock()
+        self.catalog_updates = 0
+        # Scatter-gather over catalog shard workers, when configured
+        self.shards = None
+
+        self.ready = threading.Event()
+        self.startup_seconds = {}
+        self.startup_error = None
+
+        telemetry.configure(
+            self.config.TELEMETRY_ENABLED, self.config.TELEMETRY_JSONL_FILE
+        )
+        if not defer_startup:
+            self.start()
+
+    def start(self):
+        # The model loads on its own thread while the catalog and ANN index
+        # load here; both are mostly I/O and native code. A warm-up pass runs
+        # before the engine reports ready.
+        start_time = time.perf_counter()
+        try:
+            if self.config.SHARD_WORKERS or self.config.SHARD_ADDRESSES:
+                # Local workers load their shards while this process loads
+                self.shards = ShardedSearch.from_config(self.config)
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup") as pool:
+                model_future = pool.submit(self._timed, "model", self._load_model)
+                self.catalog = self._timed("catalog", Catalog.load, self.config)
+                self.catalog.ann_index = self._timed("ann_index", self._load_ann_index)
+                self.model = model_future.result()
+
+            self.similarity_calc = SimilarityCalculator(self.model, self.config)
+            self._timed("warmup", self.similarity_calc.warm_up, self.catalog)
+            if self.shards is not None:
+                self._timed(
+                    "shards",
+                    self.shards.connect,
+                    self.catalog,
+                    self.config.SHARD_CONNECT_TIMEOUT_SECONDS,
+                )
+        except Exception as e:
+            self.startup_error = f"{type(e).__name__}: {e}"
+            print(f"Engine startup failed: {self.startup_error}")
+            raise
+
+        self.startup_seconds["total"] = time.perf_counter() - start_time
+        telemetry.register_collector(self._stats_metrics)
+        self.ready.set()
+        print(f"Engine ready in {self.startup_seconds['total']:.2f} seconds")
+
+    def health(self) -> dict:
+        if self.startup_error is not None:
+            status = "failed"
+        elif self.ready.is_set():
+            status = "ready"
+        else:
+            status = "starting"
+        health = {"status": status, "stages_seconds": dict(self.startup_seconds)}
+        if self.ready.is_set():
+            health["catalog_version"] = self.catalog.version
+        if self.startup_error is not None:
+            health["error"] = self.startup_error
+        return health
+
+    def _timed(self, stage: str, fn, *args):
+        start_time = time.perf_counter()
+        result = fn(*args)
+        self.startup_seconds[stage] = time.perf_counter() - start_time
+        print(f"Startup stage '{stage}' took {self.startup_seconds[stage]:.2f} seconds")
+        return result
+
+    def _load_model(self):
+        if self.model is not None:
+            return self.model
+        return load_encoder(self.config)
+
+    def _load_ann_index(self):
+        if self.config.SEARCH_MODE != "ann":
+            return None
+        if not os.path.exists(self.config.ANN_INDEX_FILE):
+            print(
+                f"SEARCH_MODE is 'ann' but {self.config.ANN_INDEX_FILE} is missing, "
+                "falling back to exact search"
+            )
+            return None
+
+        ann_index = IVFIndex.load(self.config.ANN_INDEX_FILE)
+        if ann_index.n_rows != len(self.catalog):
+            print(
+                f"ANN index covers {ann_index.n_rows} rows but catalog has "
+                f"{len(self.catalog)}, falling back to exact search"
+            )
+            return None
+        print(f"Loaded ANN index with {ann_index.n_lists} lists")
+        return ann_index
+
+    def apply_catalog_delta(self, delta: CatalogDelta) -> dict:
+        # Builds the next catalog snapshot off to the side and swaps it in
+        # with a single assignment; requests already running keep the one
+        # they started with.
+        if not self.ready.is_set():
+            raise RuntimeError("The recommender is still starting")
+        if self.shards is not None:
+            # Shard workers hold the startup catalog's rows
+            raise ValueError("Catalog deltas are not supported with sharded scoring")
+        with self._update_lock, telemetry.span("catalog_update"):
+            start_time = time.perf_counter()
+            catalog, summary = apply_delta(self.catalog, delta, self._encode_documents)
+            self.catalog = catalog
+            self.catalog_updates += 1
+            # Old entries are keyed on the old version; free their memory
+            self.result_cache.clear()
+            if self.bitmap_cache is not None:
+                self.bitmap_cache.clear()
+        summary["seconds"] = time.perf_counter() - start_time
+        telemetry.count("catalog_updates")
+        print(f"Catalog updated to {summary['version']}: {summary}")
+        return summary
+
+    def _encode_documents(self, texts: list) -> np.ndarray:
+        return self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32)
+
+    def get_recommendations(self, user_query: str, top_k: int = 40):
+        with telemetry.trace("recommendation", query=user_query, top_k=top_k):
+            return self._get_recommendations(user_query, top_k)
+
+    def _get_recommendations(self, user_query: str, top_k: int = 40):
+        print(f"Starting recommendation process for query: '{user_query}'")
+        if not user_query.strip():
+            return "Please enter some text.", None
+        if not self.ready.is_set():
+            return "The recommender is still starting, please try again shortly.", None
+
+        try:
+            start_time = time.time()
+            _degraded.set(False)
+            with telemetry.span("parse"):
+                features = self._parse_user_query(user_query)
+            results = self._rank(features, top_k)
+
+            total_time = time.time() - start_time
+            print(f"Recommendation finished in {total_time:.4f} seconds")
+            return features.prompt_title, results, self._finish_degraded()
+
+        except Exception as e:
+            return self._handle_error(e)
+
+    async def aget_recommendations(self, user_query: str, top_k: int = 40):
+        # Same pipeline as get_recommendations, but the LLM call is awaited on
+        # the event loop and only filtering/scoring take a thread
+        if not self._try_admit():
+            telemetry.count("rejected_requests")
+            print(f"Rejecting query, {self.config.MAX_IN_FLIGHT} requests in flight")
+            return "Server is busy, please try again shortly.", None
+
+        try:
+            with telemetry.trace("recommendation", query=user_query, top_k=top_k):
+                return await self._aget_recommendations(user_query, top_k)
+        finally:
+            self._release()
+
+    async def _aget_recommendations(self, user_query: str, top_k: int = 40):
+        print(f"Starting recommendation process for query: '{user_query}'")
+        if not user_query.strip():
+            return "Please enter some text.", None
+        if not self.ready.is_set():
+            return "The recommender is still starting, please try again shortly.", None
+
+        try:
+            start_time = time.time()
+            _degraded.set(False)
+            if self.config.SPECULATIVE_MODE:
+                features, results = await self._aspeculative_rank(user_query, top_k)
+            else:
+                with telemetry.span("parse"):
+                    features = await self._aparse_user_query(user_query)
+                results = await self._run_scoring(self._rank, features, top_k)
+
+            total_time = time.time() - start_time
+            print(f"Recommendation finished in {total_time:.4f} seconds")
+            return features.prompt_title, results, self._finish_degraded()
+
+        except Exception as e:
+            return self._handle_error(e)
+
+    async def aget_recommendations_batch(self, user_queries: List[str], top_k: int = 40):
+        # Many queries in one call for offline jobs: the parses run
+        # concurrently, every theme goes through one encode call and scoring
+        # is one blocked matmul over the catalog. Returns one outcome per
+        # query, shaped like get_recommendations', and the throughput. The
+        # batch takes a single admission slot.
+        if len(user_queries) > self.config.BATCH_MAX_QUERIES:
+            message = f"At most {self.config.BATCH_MAX_QUERIES} queries per batch."
+            return self._batch_rejected(user_queries, message)
+        if not self._try_admit():
+            telemetry.count("rejected_requests")
+            return self._batch_rejected(
+                user_queries, "Server is busy, please try again shortly."
+            )
+
+        try:
+            with telemetry.trace(
+                "recommendation_batch", queries=len(user_queries), top_k=top_k
+            ):
+                return await self._aget_recommendations_batch(user_queries, top_k)
+        finally:
+            self._release()
+
+    async def _aget_recommendations_batch(self, user_queries: List[str], top_k: int):
+        if not self.ready.is_set():
+            return self._batch_rejected(
+                user_queries,
+                "The recommender is still starting, please try again shortly.",
+            )
+
+        start_time = time.perf_counter()
+        with telemetry.span("parse", queries=len(user_queries)):
+            parsed = await asyncio.gather(
+                *(self._aparse_batch_query(query) for query in user_queries)
+            )
+        try:
+            outcomes = await self._run_scoring(self._rank_batch, parsed, top_k)
+        except Exception as e:
+            outcomes = [self._handle_error(e)] * len(user_queries)
+
+        seconds = time.perf_counter() - start_time
+        throughput = {
+            "queries": len(user_queries),
+            "seconds": seconds,
+            "queries_per_second": len(user_queries) / seconds if seconds else 0.0,
+        }
+        telemetry.annotate(**throughput)
+        print(
+            f"Batch of {len(user_queries)} queries finished in {seconds:.4f} seconds "
+            f"({throughput['queries_per_second']:.1f} queries/s)"
+        )
+        return outcomes, throughput
+
+    async def _aparse_batch_query(self, user_query: str):
+        # Runs as its own task under gather, so the degraded flag set by a
+        # fallback parse stays with this query
+        if not user_query.strip():
+            return None, False
+        _degraded.set(False)
+        features = await self._aparse_user_query(user_query)
+        degraded = _degraded.get()
+        if degraded:
+            telemetry.count("degraded_responses")
+        return features, degraded
+
+    def _rank_batch(self, parsed: list, top_k: int) -> list:
+        catalog = self.catalog
+        outcomes = [None] * len(parsed)
+        pending = []
+        for i, (features, degraded) in enumerate(parsed):
+            if features is None:
+                outcomes[i] = ("Please enter some text.", None)
+                continue
+            if not features.positive_themes:
+                outcomes[i] = ("Error: Features has no positive_themes to search for", None)
+                continue
+            cache_key = self._result_cache_key(features, top_k, catalog)
+            ranked = self.result_cache.get(cache_key)
+            if ranked is not None:
+                outcomes[i] = (
+                    features.prompt_title,
+                    ranked_results(catalog, ranked),
+                    degraded,
+                )
+                continue
+            pending.append((i, features, degraded, cache_key))
+
+        if not pending:
+            return outcomes
+
+        features_list = [features for _, features, _, _ in pending]
+        with telemetry.span("filter", queries=len(pending)):
+            candidate_lists = [
+                self.filter.apply_filters(catalog, features) for features in features_list
+            ]
+            genre_score_lists = [
+                self.filter.genre_scores(catalog, features, candidates)
+                for features, candidates in zip(features_list, candidate_lists)
+            ]
+        query_embeddings = self.similarity_calc.build_query_embeddings(features_list)
+        with telemetry.span(
+            "hybrid_score",
+            queries=len(pending),
+            candidates=sum(len(c) for c in candidate_lists),
+        ):
+            batch_results = self.similarity_calc.rank_batch(
+                query_embeddings,
+                features_list,
+                catalog,
+                candidate_lists,
+                genre_score_lists,
+                top_k,
+            )
+
+        for (i, features, degraded, cache_key), results in zip(pending, batch_results):
+            self.result_cache.set(
+                cache_key, {name: results[name] for name in RANKED_FIELDS}
+            )
+            outcomes[i] = (features.prompt_title, results, degraded)
+        return outcomes
+
+    @staticmethod
+    def _batch_rejected(user_queries: List[str], message: str):
+        throughput = {"queries": len(user_queries), "seconds": 0.0, "queries_per_second": 0.0}
+        return [(message, None)] * len(user_queries), throughput
+
+    async def aget_recommendations_page(
+        self,
+        user_query: Optional[str] = None,
+        cursor: Optional[str] = None,
+        page_size: int = 40,
+    ):
+        # The first page comes from a query, later pages from the cursor the
+        # previous page returned. Outcomes are get_recommendations' plus the
+        # next page's cursor, which is None after the last page.
+        if not self._try_admit():
+            telemetry.count("rejected_requests")
+            return "Server is busy, please try again shortly.", None
+
+        try:
+            with telemetry.trace(
+                "recommendation_page",
+                query=user_query,
+                cursor=cursor,
+                page_size=page_size,
+            ):
+                return await self._aget_recommendations_page(
+                    user_query, cursor, page_size
+                )
+        finally:
+            self._release()
+
+    async def _aget_recommendations_page(
+        self, user_query: Optional[str], cursor: Optional[str], page_size: int
+    ):
+        if not self.ready.is_set():
+            return "The recommender is still starting, please try again shortly.", None
+        page_size = min(max(page_size, 1), self.config.PAGINATION_MAX_PAGE_SIZE)
+
+        try:
+            if cursor:
+                return await self._run_scoring(self._next_page, cursor, page_size)
+            if not user_query or not user_query.strip():
+                return "Please enter some text.", None
+            _degraded.set(False)
+            with telemetry.span("parse"):
+                features = await self._aparse_user_query(user_query)
+            degraded = self._finish_degraded()
+            return await self._run_scoring(
+                self._first_page, features, degraded, page_size
+            )
+        except Exception as e:
+            return self._handle_error(e)
+
+    def _first_page(self, features: Features, degraded: bool, page_size: int):
+        catalog = self.catalog
+        depth = max(self.config.PAGINATION_DEPTH, page_size)
+        entry = self._cursor_entry(features, degraded, depth, catalog)
+        cursor_id = self.cursors.open(entry)
+        return self._page(cursor_id, entry, 0, page_size, catalog)
+
+    def _next_page(self, cursor: str, page_size: int):
+        cursor_id, _, offset = cursor.partition(".")
+        entry = self.cursors.get(cursor_id) if offset.isdigit() else None
+        if entry is None:
+            return "This cursor has expired, please search again.", None
+        offset = int(offset)
+        catalog = self.catalog
+
+        # Pages are slices of the stored ranking. Past its end, or once a
+        # catalog update has changed the row ids, the cached Features are
+        # ranked again; nothing is re-parsed.
+        depth = entry["depth"]
+        if offset + page_size > len(entry["ranked"]["row"]) and not entry["exhausted"]:
+            depth = max(2 * depth, offset + page_size)
+        if depth != entry["depth"] or entry["version"] != catalog.version:
+            telemetry.annotate(cursor="reranked")
+            entry = self._cursor_entry(
+                entry["features"], entry["degraded"], depth, catalog
             )
+            self.cursors.update(cursor_id, entry)
+        return self._page(cursor_id, entry, offset, page_size, catalog)
+
+    def _cursor_entry(
+        self, features: Features, degraded: bool, depth: int, catalog: Catalog
+    ) -> dict:
+        results = self._ranked(features, depth, catalog)
+        return {
+            "features": features,
+            "degraded": degraded,
+            "version": catalog.version,
+            "depth": depth,
+            # Fewer rows than asked for means every candidate is ranked
+            "exhausted": result_count(results) < depth,
+            "ranked": {name: results[name] for name in RANKED_FIELDS},
+        }
+
+    def _page(
+        self, cursor_id: str, entry: dict, offset: int, page_size: int, catalog: Catalog
+    ):
+        ranked = entry["ranked"]
+        end = offset + page_size
+        results = ranked_results(
+            catalog, {name: values[offset:end] for name, values in ranked.items()}
+        )
+        more = end < len(ranked["row"]) or not entry["exhausted"]
+        next_cursor = f"{cursor_id}.{end}" if more else None
+
+        print(f"Serving results {offset}-{offset + result_count(results)} of a cursor")
+        telemetry.annotate(results=result_count(results), offset=offset)
+        return entry["features"].prompt_title, results, entry["degraded"], next_cursor
+
+    async def _aspeculative_rank(self, user_query: str, top_k: int):
+        cache_key = self._parse_cache_key(user_query)
+        features = self._cached_features(cache_key)
+        if features is not None:
+            # Nothing to overlap with
+            return features, await self._run_scoring(self._rank, features, top_k)
 
-            response_model = response.choices[0].message.parsed
-            print(f"Response content: {response_model.model_dump_json(indent=2)}")
-            return response_model
+        parse_task = asyncio.create_task(self._arequest_features(user_query, cache_key))
+        stop_speculating = threading.Event()
+        speculation = asyncio.ensure_future(
+            self._run_scoring(self._speculate, user_query, stop_speculating)
+        )
+        try:
+            with telemetry.span("parse"):
+                features = await asyncio.wait_for(
+                    parse_task, self.config.PARSE_DEADLINE_SECONDS
+                )
+        except Exception as e:
+            print(f"Parse failed ({type(e).__name__}), serving the raw query ranking")
+            telemetry.count("speculative_fallbacks", reason=type(e).__name__)
+            telemetry.annotate(speculative="fallback")
+            features = self._fallback_features(user_query, e)
+            try:
+                query_embedding, catalog, candidate_indices = await speculation
+            except Exception as speculation_error:
+                print(
+                    f"Speculative pre-rank failed ({type(speculation_error).__name__}), "
+                    "ranking the filtered catalog instead"
+                )
+                return features, await self._run_scoring(self._rank, features, top_k)
+            results = await self._run_scoring(
+                self._rank_candidates,
+                features,
+                query_embedding,
+                catalog,
+                candidate_indices,
+                top_k,
+            )
+            return features, results
+
+        # The parse won. The raw-query embedding and pre-rank ignore the parsed
+        # themes and filters, so nothing in them is reusable: stop the
+        # speculation before its catalog scan, or before it starts at all
+        telemetry.annotate(speculative="parsed")
+        stop_speculating.set()
+        speculation.cancel()
+        speculation.add_done_callback(self._discard_speculation)
+        return features, await self._run_scoring(self._rank, features, top_k)
+
+    @staticmethod
+    def _discard_speculation(speculation: asyncio.Future):
+        # Retrieves the dropped speculation's outcome so a failure is logged
+        # instead of surfacing as "exception was never retrieved"
+        if not speculation.cancelled() and speculation.exception() is not None:
+            error = speculation.exception()
+            print(f"Dropped speculative pre-rank failed: {type(error).__name__}: {error}")
+
+    def _speculate(self, user_query: str, stop: threading.Event):
+        catalog = self.catalog
+        with telemetry.span("speculate"):
+            query_embedding = self.similarity_calc.build_query_embedding(
+                self._raw_query_features(user_query)
+            )
+            if stop.is_set():
+                return None
+            candidate_indices = self.similarity_calc.prerank(
+                query_embedding, catalog, self.config.SPECULATIVE_PRERANK_SIZE
+            )
+        return query_embedding, catalog, candidate_indices
+
+    def _rank_candidates(
+        self, features, query_embedding, catalog, candidate_indices, top_k: int
+    ):
+        # Scores the pre-ranked rows that pass the heuristic filters; when too
+        # few survive, the filtered catalog is ranked as usual instead. The
+        # row ids belong to `catalog`, the snapshot the pre-rank ran on.
+        with telemetry.span("filter") as span:
+            filtered = self.filter.apply_filters(catalog, features)
+            candidate_indices = np.intersect1d(
+                candidate_indices, filtered, assume_unique=True
+            )
+            span.set(candidates=len(candidate_indices))
+        if len(candidate_indices) < top_k:
+            return self._rank(features, top_k)
+
+        genre_scores = self.filter.genre_scores(catalog, features, candidate_indices)
+        with telemetry.span("hybrid_score", candidates=len(candidate_indices)):
+            scored = self.similarity_calc.score_candidates(
+                query_embedding, features, catalog, candidate_indices, genre_scores, top_k
+            )
+        results = self.similarity_calc.select_top_k(catalog, scored, top_k)
+        print(f"Found {result_count(results)} results.")
+        telemetry.annotate(results=result_count(results))
+        return results
+
+    def _rank(self, features: Features, top_k: int):
+        # One snapshot for the whole request; catalog updates swap in a new
+        # one without touching it
+        results = self._ranked(features, top_k, self.catalog)
+        print(f"Found {result_count(results)} results.")
+        telemetry.annotate(results=result_count(results))
+        return results
+
+    def _ranked(self, features: Features, top_k: int, catalog: Catalog):
+        cache_key = self._result_cache_key(features, top_k, catalog)
+        ranked = self.result_cache.get(cache_key)
+        if ranked is not None:
+            telemetry.annotate(result_cache="hit")
+            results = ranked_results(catalog, ranked)
+        else:
+            results, complete = self._search(features, top_k, catalog)
+            # A ranking from the recovery sample is not the real one
+            if complete:
+                self.result_cache.set(
+                    cache_key, {name: results[name] for name in RANKED_FIELDS}
+                )
+        return results
+
+    def _search(self, features: Features, top_k: int, catalog: Catalog):
+        if self.shards is not None:
+            return self._sharded_search(features, top_k, catalog), True
+
+        complete = True
+        with telemetry.span("filter") as span:
+            candidate_indices = self.filter.apply_filters(catalog, features)
+            genre_scores = self.filter.genre_scores(catalog, features, candidate_indices)
+            span.set(candidates=len(candidate_indices))
+
+        try:
+            search_results = self.similarity_calc.calculate_similarity(
+                features, catalog, candidate_indices, genre_scores, top_k
+            )
+        except Exception as similarity_error:
+            print(f"Error in similarity calculation: {str(similarity_error)}")
+            print(f"Traceback: {traceback.format_exc()}")
+
+            print("Attempting recovery with smaller dataset...")
+            if len(candidate_indices) > 1000:
+                sample = np.sort(
+                    np.random.default_rng(42).choice(
+                        len(candidate_indices), size=1000, replace=False
+                    )
+                )
+                search_results = self.similarity_calc.calculate_similarity(
+                    features,
+                    catalog,
+                    candidate_indices[sample],
+                    genre_scores[sample],
+                    top_k,
+                )
+                complete = False
+                print("Recovery successful with smaller dataset")
+            else:
+                raise similarity_error
+
+        return search_results["results"], complete
+
+    def _sharded_search(self, features: Features, top_k: int, catalog: Catalog):
+        # Queries are encoded here; filtering and scoring run on the shards
+        query_embedding = self.similarity_calc.build_query_embedding(features)
+        with telemetry.span("sharded_search", shards=len(self.shards.shards)):
+            ranked = self.shards.search(features, query_embedding.numpy(), top_k)
+        return ranked_results(catalog, ranked)
+
+    def _handle_error(self, e: Exception):
+        telemetry.count("errors", stage="recommendation")
+        print(f"Critical error in recommendation process: {str(e)}")
+        print(f"Full traceback: {traceback.format_exc()}")
+        print(f"Exception type: {type(e).__name__}")
+
+        try:
+            import psutil
+
+            process = psutil.Process()
+            memory_usage = process.memory_info().rss / 1024 / 1024
+            print(f"Current memory usage: {memory_usage:.2f} MB")
+        except:
+            pass
+
+        return f"Error: {str(e)}", None
+
+    async def _run_scoring(self, fn, *args):
+        # run_in_executor does not carry contextvars over, so the request
+        # trace is passed along explicitly
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.scoring_executor, lambda: context.run(fn, *args)
+        )
+
+    def _try_admit(self) -> bool:
+        with self._in_flight_lock:
+            if self._in_flight >= self.config.MAX_IN_FLIGHT:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "parse_cache": self.parse_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "cursors": self.cursors.stats(),
+            "filter_bitmaps": self.bitmap_cache.stats() if self.bitmap_cache else {},
+            "embedding_cache": self.similarity_calc.embedding_cache.stats(),
+            "embedding_batcher": self.similarity_calc.batcher.stats(),
+            "admission": {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.config.MAX_IN_FLIGHT,
+            },
+            "startup_seconds": dict(self.startup_seconds),
+            "catalog": {"rows": len(self.catalog), "updates": self.catalog_updates},
+            "sharding": {"workers": len(self.shards.shards) if self.shards else 0},
+        }
+
+    def _stats_metrics(self) -> dict:
+        # Flattens stats() into Prometheus samples, e.g. parse_cache_misses
+        metrics = {}
+        for section, values in self.stats().items():
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for bucket, bucket_value in value.items():
+                        metrics[(f"{section}_{key}", (("bucket", f"{bucket:g}"),))] = bucket_value
+                else:
+                    metrics[(f"{section}_{key}", ())] = value
+        return metrics
+
+    def _parse_cache_key(self, query: str) -> str:
+        normalized_query = re.sub(r"\s+", " ", query).strip().casefold()
+        return hashlib.sha256(
+            f"{self._parse_cache_namespace}\n{normalized_query}".encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _result_cache_key(features: Features, top_k: int, catalog: Catalog) -> str:
+        # Canonical form of everything ranking reads: list order never
+        # matters, empty themes are absent and prompt_title is display-only.
+        # genres keeps its duplicates, since genre_scores divides by its
+        # length; the other lists are only tested for membership
+        canonical = features.model_dump(exclude={"prompt_title"})
+        canonical["genres"] = sorted(canonical["genres"])
+        for field in (
+            "negative_genres",
+            "country_of_origin",
+            "dont_wanted_countrys",
+        ):
+            canonical[field] = sorted(set(canonical[field]))
+        for field in ("positive_themes", "negative_themes"):
+            canonical[field] = (canonical[field] or "").strip() or None
+        return hashlib.sha256(
+            json.dumps(
+                [canonical, top_k, catalog.version], sort_keys=True
+            ).encode()
+        ).hexdigest()
+
+    def _parse_user_query(self, query: str) -> Features:
+        cache_key = self._parse_cache_key(query)
+        cached = self._cached_features(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            # The client's own timeout is the deadline; a retry would overrun it
+            response = self.client.with_options(
+                timeout=self.config.PARSE_DEADLINE_SECONDS, max_retries=0
+            ).beta.chat.completions.parse(**self._parse_request(query))
+            return self._store_parsed(cache_key, response)
         except Exception as e:
             print(f"Parse error traceback: {traceback.format_exc()}")
-            return Features(
-                movie_or_series="both",
-                genres=[],
-                quality_level="any",
-                themes=[query],
-                date_range=[1900, 2025],
-                negative_keywords=[],
-                production_region=[],
+            return self._fallback_features(query, e)
+
+    async def _aparse_user_query(self, query: str) -> Features:
+        cache_key = self._parse_cache_key(query)
+        cached = self._cached_features(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            return await asyncio.wait_for(
+                self._arequest_features(query, cache_key),
+                self.config.PARSE_DEADLINE_SECONDS,
             )
+        except Exception as e:
+            print(f"Parse error traceback: {traceback.format_exc()}")
+            return self._fallback_features(query, e)
 
-    def _create_results_dataframe(self, search_results: dict) -> pd.DataFrame:
-        if not search_results["results"]:
-            return pd.DataFrame()
+    async def _arequest_features(self, query: str, cache_key: str) -> Features:
+        response = await self.async_client.beta.chat.completions.parse(
+            **self._parse_request(query)
+        )
+        return self._store_parsed(cache_key, response)
 
-        df_data = []
-        for result in search_results["results"]:
-            df_data.append(
-                {
-                    "tconst": result["tconst"],
-                    "title": result["title"],
-                    "type": result["type"],
-                    "year": result["year"],
-                    "rating": result["rating"],
-                    "runtimeMinutes": result["runtimeMinutes"],
-                    "votes": result["votes"],
-                    "genres": result["genres"],
-                    "similarity_score": f"{result['similarity_score']:.4f}",
-                    "hybrid_score": f"{result['hybrid_score']:.4f}",
-                    "overview": result["overview"],
-                    "final_score": f"{result['final_score']:.4f}",
-                    "genre_score": f"{result['genre_score']:.4f}",
-                    "poster_url": result["poster_url"],
-                    "country_of_origin": result["country_of_origin"],
-                }
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        # Created on first use so engines that never take the async path
+        # (benchmarks, offline jobs) need no API key for it
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self.config.OPENAI_API_KEY,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.config.LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=self.config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    )
+                ),
             )
-        return pd.DataFrame(df_data)
+        return self._async_client
+
+    def _cached_features(self, cache_key: str) -> Optional[Features]:
+        cached = self.parse_cache.get(cache_key)
+        if cached is None:
+            telemetry.annotate(parse_cache="miss")
+            return None
+        print("Parsed features served from cache")
+        telemetry.annotate(parse_cache="hit")
+        return Features.model_validate_json(cached)
+
+    def _parse_request(self, query: str) -> dict:
+        return {
+            "model": self.config.LLM_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT,
+                },
+                {"role": "user", "content": query},
+            ],
+            "response_format": Features,
+        }
+
+    def _store_parsed(self, cache_key: str, response) -> Features:
+        response_model = response.choices[0].message.parsed
+        print(f"Response content: {response_model.model_dump_json(indent=2)}")
+        self.parse_cache.set(cache_key, response_model.model_dump_json())
+        return response_model
+
+    def _fallback_features(self, query: str, error: Exception) -> Features:
+        if isinstance(error, (asyncio.TimeoutError, APITimeoutError)):
+            print(f"Parse missed its {self.config.PARSE_DEADLINE_SECONDS}s deadline")
+            telemetry.count("parse_deadline_misses")
+        else:
+            telemetry.count("parse_failures")
+        _degraded.set(True)
+        return self.heuristic_parser.parse(query)
+
+    def _finish_degraded(self) -> bool:
+        degraded = _degraded.get()
+        if degraded:
+            print("Serving a degraded response from heuristically parsed features")
+            telemetry.count("degraded_responses")
+            telemetry.annotate(degraded=True)
+        return degraded
+
+    def _raw_query_features(self, query: str) -> Features:
+        # No filters; the raw query is searched as the positive theme
+        return Features(
+            movie_or_series="both",
+            genres=[],
+            negative_genres=[],
+            quality_level="any",
+            positive_themes=query,
+            negative_themes=None,
+            date_range=[1900, 2025],
+            country_of_origin=[],
+            dont_wanted_countrys=[],
+            prompt_title=query[:60],
+        )